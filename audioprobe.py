@@ -0,0 +1,171 @@
+import struct
+
+# Bitrates in kbps, indexed by [MPEG-1?][layer][bitrate index]
+_BITRATES = {
+    True: {
+        1: [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+        2: [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+        3: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    },
+    False: {
+        1: [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+        2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+        3: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    },
+}
+# Sample rates indexed by the two version bits (0 = MPEG-2.5, 2 = MPEG-2, 3 = MPEG-1)
+_SAMPLE_RATES = {
+    0: [11025, 12000, 8000],
+    2: [22050, 24000, 16000],
+    3: [44100, 48000, 32000],
+}
+
+
+def _parse_header(data, offset):
+    """Decode the 4-byte frame header at offset, or return None if it is not a valid MPEG audio frame."""
+    if offset + 4 > len(data):
+        return None
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    if data[offset] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    version_bits = (b1 >> 3) & 0x03
+    layer = 4 - ((b1 >> 1) & 0x03)
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 0x03
+    if version_bits == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    mpeg1 = version_bits == 3
+    sample_rate = _SAMPLE_RATES[version_bits][rate_index]
+    bitrate = _BITRATES[mpeg1][layer][bitrate_index] * 1000
+    padding = (b2 >> 1) & 0x01
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if (layer == 2 or mpeg1) else 576
+        length = samples // 8 * bitrate // sample_rate + padding
+    return {
+        "mpeg1": mpeg1,
+        "layer": layer,
+        "mono": (b3 >> 6) == 3,
+        "sample_rate": sample_rate,
+        "samples": samples,
+        "length": length,
+    }
+
+
+def _skip_id3v2(data):
+    if data[:3] != b"ID3" or len(data) < 10:
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _find_frame(data, offset):
+    """Return the offset of the first frame at or after offset whose successor also lines up."""
+    while True:
+        offset = data.find(b"\xff", offset)
+        if offset < 0:
+            return -1, None
+        header = _parse_header(data, offset)
+        if header is not None:
+            following = offset + header["length"]
+            # Require a second header right after to avoid false syncs inside tag data
+            if following >= len(data) or _parse_header(data, following) is not None:
+                return offset, header
+        offset += 1
+
+
+def _xing_offset(offset, header):
+    if header["mpeg1"]:
+        side_info = 17 if header["mono"] else 32
+    else:
+        side_info = 9 if header["mono"] else 17
+    return offset + 4 + side_info
+
+
+def _is_info_frame(data, offset, header):
+    """True if the frame at offset carries a Xing/Info/VBRI header instead of audio."""
+    xing_offset = _xing_offset(offset, header)
+    return (data[xing_offset:xing_offset + 4] in (b"Xing", b"Info")
+            or data[offset + 36:offset + 40] == b"VBRI")
+
+
+def _xing_info(data, offset, header):
+    """Frame and sample counts from a Xing/Info (with LAME gapless info) or VBRI header, or None."""
+    tag_offset = _xing_offset(offset, header)
+    tag = data[tag_offset:tag_offset + 4]
+    if tag in (b"Xing", b"Info"):
+        flags = struct.unpack(">I", data[tag_offset + 4:tag_offset + 8])[0]
+        if not flags & 0x01:
+            return None
+        frames = struct.unpack(">I", data[tag_offset + 8:tag_offset + 12])[0]
+        samples = frames * header["samples"]
+        # The LAME extension follows whichever optional Xing fields are present
+        lame_offset = tag_offset + 8 + 4 * bool(flags & 0x01) + 4 * bool(flags & 0x02) + 100 * bool(flags & 0x04) + 4 * bool(flags & 0x08)
+        # Written by LAME and by ffmpeg ("Lavc..."); the 9-byte encoder name tells us one is there
+        encoder = data[lame_offset:lame_offset + 9]
+        if lame_offset + 24 <= len(data) and encoder[:1].isalpha():
+            delay_padding = data[lame_offset + 21:lame_offset + 24]
+            encoder_delay = (delay_padding[0] << 4) | (delay_padding[1] >> 4)
+            encoder_padding = ((delay_padding[1] & 0x0F) << 8) | delay_padding[2]
+            # Decoders such as ffmpeg drop the encoder delay and padding
+            samples -= encoder_delay + encoder_padding
+        return {"frames": frames, "samples": max(samples, 0)}
+
+    vbri_offset = offset + 4 + 32
+    if data[vbri_offset:vbri_offset + 4] == b"VBRI":
+        frames = struct.unpack(">I", data[vbri_offset + 14:vbri_offset + 18])[0]
+        return {"frames": frames, "samples": frames * header["samples"]}
+    return None
+
+
+def mp3_duration_ms(path):
+    """Duration of an MP3 file in milliseconds, read from frame headers without decoding audio.
+
+    Every frame header is visited (a hop per frame, no decoding). If the
+    file starts with a Xing/Info or VBRI header, its gapless sample count
+    (LAME encoder delay and padding removed) is used, but only when its
+    frame count matches the frames that follow it. Further MPEG streams
+    concatenated after the first (as gTTS produces) are added by counting
+    their audio frames, the way decoders play them, resynchronizing after
+    embedded tags; their own info frames are skipped.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    offset, header = _find_frame(data, _skip_id3v2(data))
+    if header is None:
+        raise ValueError(f"No MPEG audio frames found in {path}")
+
+    streams = []
+    stream = None
+    while header is not None:
+        if _is_info_frame(data, offset, header):
+            stream = {"info": _xing_info(data, offset, header), "rate": header["sample_rate"], "frames": 0, "seconds": 0.0}
+            streams.append(stream)
+        else:
+            if stream is None:
+                stream = {"info": None, "rate": header["sample_rate"], "frames": 0, "seconds": 0.0}
+                streams.append(stream)
+            stream["frames"] += 1
+            stream["seconds"] += header["samples"] / header["sample_rate"]
+        offset += header["length"]
+        next_header = _parse_header(data, offset)
+        if next_header is None:
+            # Lost sync: skip over an embedded tag or junk to the next real frame
+            offset, next_header = _find_frame(data, offset + 1)
+        header = next_header
+
+    seconds = 0.0
+    for index, stream in enumerate(streams):
+        info = stream["info"]
+        # Decoders only apply gapless trimming from the header at the start of the file;
+        # encoders count the audio frames with or without the info frame itself
+        if index == 0 and info is not None and abs(info["frames"] - stream["frames"]) <= 1:
+            seconds += info["samples"] / stream["rate"]
+        else:
+            seconds += stream["seconds"]
+    return round(seconds * 1000)
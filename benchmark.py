@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""Performance benchmarks for the rendering pipeline.
+
+    ./benchmark.py encoders reference.mp4 [--settings settings.json] [--profiles fast,small] [--output results.json]
+    ./benchmark.py pipeline [--scenes 8] [--modes opencv,pipe] [--captions native] [--work-dir DIR] [--output results.json]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+
+import audioprobe
+from encoding import container_args, video_codec_args
+
+
+def _children_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def measure_quality(encoded_file, reference_file):
+    """Return (ssim, psnr) of encoded_file against reference_file using ffmpeg's filters."""
+    command = [
+        'ffmpeg', '-hide_banner', '-nostats',
+        '-i', encoded_file,
+        '-i', reference_file,
+        '-lavfi', '[0:v]split[a0][a1];[1:v]split[b0][b1];[a0][b0]ssim;[a1][b1]psnr',
+        '-f', 'null', '-',
+    ]
+    result = subprocess.run(command, capture_output=True, text=True)
+    ssim = re.search(r"SSIM .*All:([0-9.]+)", result.stderr)
+    psnr = re.search(r"PSNR .*average:([0-9.]+|inf)", result.stderr)
+    return (
+        float(ssim.group(1)) if ssim else None,
+        float(psnr.group(1)) if psnr else None,
+    )
+
+
+def benchmark_encoders(reference_file, settings, profile_names):
+    """Encode reference_file once per encoder profile and collect speed, size and quality."""
+    results = []
+    with tempfile.TemporaryDirectory(prefix="encoder-bench-") as work_dir:
+        for name in profile_names:
+            output_file = os.path.join(work_dir, f"{name}.mp4")
+            command = [
+                'ffmpeg', '-y', '-loglevel', 'error',
+                '-i', reference_file,
+                '-an',
+                *video_codec_args(settings, name),
+                *container_args(settings, name),
+                output_file,
+            ]
+            print(f"Encoding with profile '{name}'...")
+            cpu_before = _children_cpu_seconds()
+            started = time.perf_counter()
+            result = subprocess.run(command, capture_output=True, text=True)
+            wall_time = time.perf_counter() - started
+            cpu_time = _children_cpu_seconds() - cpu_before
+            if result.returncode != 0:
+                print(f"FFmpeg failed for profile '{name}': {result.stderr.strip()}")
+                continue
+
+            ssim, psnr = measure_quality(output_file, reference_file)
+            results.append({
+                "profile": name,
+                "wall_seconds": round(wall_time, 3),
+                "cpu_seconds": round(cpu_time, 3),
+                "size_bytes": os.path.getsize(output_file),
+                "ssim": ssim,
+                "psnr": psnr,
+            })
+    return results
+
+
+def make_fixture(fixture_dir, settings, scene_count, scene_seconds):
+    """Write synthetic scene images, silent narration clips and narration.json into fixture_dir."""
+    import cv2
+    import numpy as np
+
+    # images.create_from_data stores scenes at the video frame size
+    video_settings = settings.get("video", {})
+    width = video_settings.get("width", 720)
+    height = video_settings.get("height", 1280)
+    os.makedirs(os.path.join(fixture_dir, "images"), exist_ok=True)
+    os.makedirs(os.path.join(fixture_dir, "narrations"), exist_ok=True)
+
+    rng = np.random.default_rng(0)
+    narration_data = []
+    for i in range(1, scene_count + 1):
+        # Gradient plus noise so the encoder sees detail comparable to a generated image
+        gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+        image = np.clip(gradient + rng.normal(0, 24, (height, width, 3)) + 20 * i, 0, 255).astype(np.uint8)
+        cv2.imwrite(os.path.join(fixture_dir, "images", f"image_{i}.png"), image)
+
+        duration = scene_seconds + 0.25 * (i % 3)
+        filename = f"narration_{i}.mp3"
+        subprocess.run([
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-f', 'lavfi', '-i', 'anullsrc=r=24000:cl=mono',
+            '-t', f"{duration:.3f}",
+            '-b:a', '32k',
+            os.path.join(fixture_dir, "narrations", filename),
+        ], check=True)
+        text = f"Scene {i} tells the children something new about a curious animal."
+        duration_ms = audioprobe.mp3_duration_ms(os.path.join(fixture_dir, "narrations", filename))
+        narration_data.append({"filename": filename, "duration": duration_ms, "text": text})
+
+    with open(os.path.join(fixture_dir, "narration.json"), "w") as f:
+        json.dump(narration_data, f)
+    return narration_data
+
+
+def seed_transcripts(fixture_dir, narration_data, settings):
+    """Store evenly spaced word timings in the transcript cache so no ASR runs during the benchmark."""
+    import cache
+    import transcription
+
+    model_name = settings.get("transcription", {}).get("model", transcription.DEFAULT_MODEL)
+    transcript_dir = cache.cache_dir("transcripts")
+    for item in narration_data:
+        audio_file = os.path.join(fixture_dir, "narrations", item["filename"])
+        words = item["text"].split()
+        step = item["duration"] / 1000 / len(words)
+        segments = [{
+            "start": 0.0,
+            "end": item["duration"] / 1000,
+            "text": item["text"],
+            "words": [{"word": f" {word}", "start": k * step, "end": (k + 1) * step} for k, word in enumerate(words)],
+        }]
+        key = cache.content_key(cache.file_digest(audio_file), item["text"], model_name)
+        cache.write_json(os.path.join(transcript_dir, f"{key}.json"), segments)
+
+
+def filesystem_type(path):
+    """Filesystem type of the mount holding path, from /proc/mounts (None where unavailable)."""
+    path = os.path.realpath(path)
+    best = ("", None)
+    try:
+        with open("/proc/mounts") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount_point = fields[1].replace("\\040", " ")
+                inside = path == mount_point or path.startswith(mount_point.rstrip("/") + "/")
+                if inside and len(mount_point) >= len(best[0]):
+                    best = (mount_point, fields[2])
+    except OSError:
+        return None
+    return best[1]
+
+
+def _run_pipeline(output_dir, settings, results):
+    """Render the fixture in output_dir with video.create; runs in a fresh process for clean RSS figures."""
+    import video
+
+    with open(os.path.join(output_dir, "narration.json")) as f:
+        narration_data = json.load(f)
+    narrations = [item["text"] for item in narration_data]
+
+    # Bytes written by this process and the ffmpeg runs it reaps; parallel mode's
+    # pool workers are never reaped here and report their own share in usage
+    written_before = video.written_bytes()
+    timings = {}
+    usage = {}
+    started = time.perf_counter()
+    video.create(narrations, output_dir, "output_video.mp4", settings, timings=timings, usage=usage)
+    total = time.perf_counter() - started
+    written_after = video.written_bytes()
+
+    video_settings = settings.get("video", {})
+    frame_rate = video_settings.get("fps", 30)
+    frames = sum(
+        sum(video.scene_frame_budget(narration_data, i, frame_rate, video_settings.get("slide_speed_multiplier", 1)))
+        for i in range(len(narration_data))
+    )
+    final_output = os.path.join(output_dir, "final_output.mp4")
+    output_bytes = os.path.getsize(final_output) if os.path.exists(final_output) else None
+    temp_written = None
+    worker_written = usage.get("worker_written_bytes", 0)
+    counted = filesystem_type(output_dir) not in ("tmpfs", "ramfs")
+    if counted and None not in (written_before, written_after, worker_written):
+        # Everything written except final_output.mp4 itself (a hardlink when reprocess is off costs nothing)
+        temp_written = max(written_after - written_before + worker_written - (output_bytes or 0), 0)
+    results.put({
+        "frames": frames,
+        "total_seconds": round(total, 3),
+        "fps": round(frames / total, 1),
+        "stages": {stage: round(seconds, 3) for stage, seconds in timings.items()},
+        # ru_maxrss is reported in KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_child_rss_mb": max(round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+                                 usage.get("worker_peak_rss_mb", 0)),
+        "temp_written_bytes": temp_written,
+        "output_bytes": output_bytes,
+    })
+
+
+def benchmark_pipeline(settings, modes, scene_count, scene_seconds, caption_renderer=None, work_root=None):
+    """Render a synthetic short once per render mode and collect stage timings and resource use.
+
+    work_root holds the throwaway fixture and renders. It defaults to
+    $CACHE_DIR/benchmark, which is disk-backed, unlike a tmpfs /tmp, so
+    temp bytes written can be measured.
+    """
+    import cache
+
+    work_root = work_root or os.path.join(cache.cache_root(), "benchmark")
+    os.makedirs(work_root, exist_ok=True)
+    if filesystem_type(work_root) in ("tmpfs", "ramfs"):
+        print(f"Warning: {work_root} is in memory, so temp bytes written cannot be measured; pass --work-dir on disk.")
+    results = []
+    with tempfile.TemporaryDirectory(prefix="pipeline-bench-", dir=work_root) as work_dir:
+        # Keep the seeded transcripts away from the real cache
+        os.environ["CACHE_DIR"] = os.path.join(work_dir, "cache")
+        fixture_dir = os.path.join(work_dir, "fixture")
+        print(f"Generating {scene_count} synthetic scenes...")
+        narration_data = make_fixture(fixture_dir, settings, scene_count, scene_seconds)
+        seed_transcripts(fixture_dir, narration_data, settings)
+
+        # A spawned process starts with a fresh peak RSS and may still use a process pool itself
+        context = multiprocessing.get_context("spawn")
+        for mode in modes:
+            run_settings = json.loads(json.dumps(settings))
+            run_settings.setdefault("video", {})["render_mode"] = mode
+            if caption_renderer:
+                run_settings.setdefault("captions", {})["renderer"] = caption_renderer
+            output_dir = os.path.join(work_dir, mode)
+            shutil.copytree(fixture_dir, output_dir)
+
+            print(f"Rendering with render_mode '{mode}'...")
+            queue = context.Queue()
+            process = context.Process(target=_run_pipeline, args=(output_dir, run_settings, queue))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                print(f"Render failed for render_mode '{mode}' (exit code {process.exitcode}).")
+                continue
+            results.append({"render_mode": mode, **queue.get()})
+            shutil.rmtree(output_dir)
+    return results
+
+
+def print_pipeline_table(results):
+    stages = sorted({stage for row in results for stage in row["stages"]})
+    header = f"{'mode':<12}{'total s':>10}{'fps':>8}" + "".join(f"{stage + ' s':>12}" for stage in stages)
+    print(header + f"{'RSS MB':>10}{'child MB':>10}{'temp w MB':>11}")
+    for row in results:
+        line = f"{row['render_mode']:<12}{row['total_seconds']:>10.2f}{row['fps']:>8.1f}"
+        for stage in stages:
+            seconds = row["stages"].get(stage)
+            line += f"{seconds:>12.2f}" if seconds is not None else f"{'-':>12}"
+        line += f"{row['peak_rss_mb']:>10.1f}{row['peak_child_rss_mb']:>10.1f}"
+        temp_written = row["temp_written_bytes"]
+        line += f"{temp_written / 1024 / 1024:>11.1f}" if temp_written is not None else f"{'-':>11}"
+        print(line)
+
+
+def current_commit():
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    return result.stdout.strip() or None
+
+
+def print_encoder_table(results):
+    print(f"{'profile':<16}{'wall s':>10}{'cpu s':>10}{'size MB':>10}{'SSIM':>10}{'PSNR':>10}")
+    for row in results:
+        ssim = f"{row['ssim']:.4f}" if row["ssim"] is not None else "-"
+        psnr = f"{row['psnr']:.2f}" if row["psnr"] is not None else "-"
+        print(
+            f"{row['profile']:<16}{row['wall_seconds']:>10.2f}{row['cpu_seconds']:>10.2f}"
+            f"{row['size_bytes'] / 1024 / 1024:>10.2f}{ssim:>10}{psnr:>10}"
+        )
+
+
+def write_results(results, output_file):
+    with open(output_file, "w") as f:
+        json.dump({"commit": current_commit(), "results": results}, f, indent=2)
+    print(f"Results written to {output_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    encoders = subparsers.add_parser("encoders", help="compare encoder profiles on a reference short")
+    encoders.add_argument("reference", help="reference video, e.g. /videos/<id>/final_output.mp4")
+    encoders.add_argument("--settings", default="settings.json")
+    encoders.add_argument("--profiles", help="comma-separated profile names (default: all in settings)")
+    encoders.add_argument("--output", help="write results as JSON to this file")
+
+    pipeline = subparsers.add_parser("pipeline", help="time video.create on synthetic scenes")
+    pipeline.add_argument("--settings", default="settings.json")
+    pipeline.add_argument("--scenes", type=int, default=8)
+    pipeline.add_argument("--scene-seconds", type=float, default=4.0)
+    pipeline.add_argument("--modes", default="opencv,pipe,segments,parallel",
+                          help="comma-separated render modes to compare")
+    pipeline.add_argument("--captions", choices=["captacity", "native"],
+                          help="override settings[\"captions\"][\"renderer\"]")
+    pipeline.add_argument("--output", help="write results as JSON to this file")
+    pipeline.add_argument("--work-dir", help="disk-backed directory for the fixture and renders (default: $CACHE_DIR/benchmark)")
+
+    args = parser.parse_args()
+
+    with open(args.settings) as f:
+        settings = json.load(f)
+
+    if args.command == "encoders":
+        if args.profiles:
+            profile_names = [name.strip() for name in args.profiles.split(",") if name.strip()]
+        else:
+            profile_names = list(settings.get("encoding", {}).get("profiles", {})) or ["default"]
+        results = benchmark_encoders(args.reference, settings, profile_names)
+        print_encoder_table(results)
+        if args.output:
+            write_results(results, args.output)
+    elif args.command == "pipeline":
+        modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+        results = benchmark_pipeline(settings, modes, args.scenes, args.scene_seconds, args.captions, args.work_dir)
+        print_pipeline_table(results)
+        if args.output:
+            write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def cache_root():
+    """Root of the on-disk caches; override with CACHE_DIR (defaults to ./cache in the project)."""
+    return os.getenv("CACHE_DIR", os.path.join(BASE_DIR, "cache"))
+
+def cache_dir(name):
+    path = os.path.join(cache_root(), name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def file_digest(path):
+    """SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def content_key(*parts):
+    """Stable SHA-256 key for a mix of strings and JSON-serializable values."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, str):
+            part = json.dumps(part, sort_keys=True, ensure_ascii=False)
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def read_json(path):
+    """Load a cached JSON entry, or None if it is missing or unreadable."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_json(path, value):
+    """Write a cache entry atomically so concurrent readers never see a partial file."""
+    # Per thread as well as per process: parallel TTS lines and batch shorts can store the same key at once
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(value, f)
+    os.replace(temp_path, path)
+
+def _link_or_copy(source, destination):
+    """Hardlink source to destination (replacing it atomically), copying across filesystems."""
+    temp_path = f"{destination}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        shutil.copyfile(source, temp_path)
+    os.replace(temp_path, destination)
+
+def store_file(path, entry_path):
+    """Add a finished file to the cache without copying its data when possible."""
+    _link_or_copy(path, entry_path)
+
+def fetch_file(entry_path, destination):
+    """Materialize a cached file at destination and mark it recently used; False on a miss."""
+    try:
+        _link_or_copy(entry_path, destination)
+    except FileNotFoundError:
+        return False
+    try:
+        # Modification time doubles as the last-use time for LRU eviction
+        os.utime(entry_path)
+    except OSError:
+        pass
+    return True
+
+def evict(directory, max_bytes):
+    """Delete the least recently used entries in directory until it fits in max_bytes.
+
+    Files sharing a name up to the first dot (e.g. <key>.mp3 and <key>.json)
+    form one entry and are evicted together.
+    """
+    entries = {}
+    for entry in os.scandir(directory):
+        if entry.is_file() and not entry.name.endswith(".tmp"):
+            stat = entry.stat()
+            key = entry.name.split(".")[0]
+            last_used, size, paths = entries.get(key, (0, 0, []))
+            entries[key] = (max(last_used, stat.st_mtime), size + stat.st_size, paths + [entry.path])
+    total = sum(size for _, size, _ in entries.values())
+    removed = 0
+    for last_used, size, paths in sorted(entries.values()):
+        if total <= max_bytes:
+            break
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total -= size
+        removed += 1
+    return removed
@@ -0,0 +1,271 @@
+import bisect
+import os
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw, ImageFilter, ImageFont
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Same defaults Captacity applies when a key is missing from settings["captions"]
+DEFAULT_CAPTION_SETTINGS = {
+    "font": "Bangers-Regular.ttf",
+    "font_size": 130,
+    "font_color": "yellow",
+    "stroke_width": 3,
+    "stroke_color": "black",
+    "highlight_current_word": True,
+    "word_highlight_color": "red",
+    "line_count": 2,
+    "padding": 50,
+    "shadow_strength": 1.0,
+    "shadow_blur": 0.1,
+}
+
+def resolve_font(font_path):
+    """Return an absolute font path, resolving relative paths against the project root."""
+    if isinstance(font_path, str) and font_path.strip() and not os.path.isabs(font_path):
+        return os.path.abspath(os.path.join(BASE_DIR, font_path))
+    return font_path
+
+def caption_style(caption_settings):
+    """Merge caption settings over the defaults and resolve the font path."""
+    style = {**DEFAULT_CAPTION_SETTINGS, **(caption_settings or {})}
+    style["font"] = resolve_font(style["font"])
+    return style
+
+def load_font(style):
+    try:
+        return ImageFont.truetype(style["font"], style["font_size"])
+    except OSError:
+        print(f"Warning: Caption font '{style['font']}' not found. Using Pillow's default font.")
+        return ImageFont.load_default(style["font_size"])
+
+def layout_captions(segments, style, width, font=None):
+    """Group transcribed words into on-screen captions.
+
+    Words are wrapped into lines no wider than the frame minus padding, and
+    each caption holds at most line_count lines. A new caption also starts at
+    every segment boundary so captions do not straddle sentences.
+    """
+    font = font or load_font(style)
+    max_width = width - 2 * style["padding"]
+    line_count = max(1, style["line_count"])
+    captions = []
+
+    def flush(lines):
+        if lines:
+            captions.append({
+                "start": lines[0][0]["start"],
+                "end": lines[-1][-1]["end"],
+                "lines": lines,
+            })
+
+    for segment in segments:
+        lines, line = [], []
+        for word in segment.get("words", []):
+            text = word["word"].strip()
+            if not text:
+                continue
+            candidate = " ".join([w["text"] for w in line] + [text])
+            if line and font.getlength(candidate) > max_width:
+                lines.append(line)
+                line = []
+                if len(lines) == line_count:
+                    flush(lines)
+                    lines = []
+            line.append({"text": text, "start": word["start"], "end": word["end"]})
+        if line:
+            lines.append(line)
+        flush(lines)
+
+    return captions
+
+class CaptionRenderer:
+    """Composite captions into BGR frames in process.
+
+    Each word is rasterized once per highlight state into a premultiplied
+    sprite; drawing a caption is then a handful of small multiply-adds over
+    the frame, with no ImageMagick or MoviePy involved.
+    """
+
+    def __init__(self, segments, style, width, height):
+        self.style = style
+        self.width = width
+        self.height = height
+        self.font = load_font(style)
+        self.captions = layout_captions(segments, style, width, self.font)
+        self.starts = [caption["start"] for caption in self.captions]
+        self.sprites = {}
+
+        ascent, descent = self.font.getmetrics()
+        stroke = style["stroke_width"]
+        self.line_height = ascent + descent + 2 * stroke
+        self.shadow_radius = style["shadow_blur"] * style["font_size"] if style["shadow_strength"] > 0 else 0
+        self.margin = stroke + int(np.ceil(self.shadow_radius * 2))
+        self.space_width = self.font.getlength(" ")
+        for caption in self.captions:
+            self._place_words(caption)
+
+    def _place_words(self, caption):
+        """Work out the top-left position of every word, centring the block in the frame."""
+        block_height = self.line_height * len(caption["lines"])
+        y = (self.height - block_height) // 2
+        for line in caption["lines"]:
+            line_width = self.font.getlength(" ".join(word["text"] for word in line))
+            x = (self.width - line_width) / 2
+            for word in line:
+                word["x"] = int(round(x))
+                word["y"] = int(y)
+                x += self.font.getlength(word["text"]) + self.space_width
+            y += self.line_height
+
+    def state_at(self, t):
+        """Return (caption index, highlighted word index) for time t, or None when nothing is shown."""
+        index = bisect.bisect_right(self.starts, t) - 1
+        if index < 0 or t >= self.captions[index]["end"]:
+            return None
+        if not self.style["highlight_current_word"]:
+            return index, -1
+        words = [word for line in self.captions[index]["lines"] for word in line]
+        current = bisect.bisect_right([word["start"] for word in words], t) - 1
+        return index, max(current, 0)
+
+    def draw(self, frame, state):
+        """Draw the caption for state onto frame in place and return it."""
+        if state is None:
+            return frame
+        index, current = state
+        words = [word for line in self.captions[index]["lines"] for word in line]
+        for k, word in enumerate(words):
+            premultiplied, inverse_alpha = self._sprite(word["text"], k == current)
+            x = word["x"] - self.margin
+            y = word["y"] - self.margin
+            sprite_h, sprite_w = premultiplied.shape[:2]
+            # Clip sprites that would hang off the frame edges
+            x0, y0 = max(x, 0), max(y, 0)
+            x1, y1 = min(x + sprite_w, self.width), min(y + sprite_h, self.height)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            region = frame[y0:y1, x0:x1]
+            sprite_slice = (slice(y0 - y, y1 - y), slice(x0 - x, x1 - x))
+            region[...] = region * inverse_alpha[sprite_slice] + premultiplied[sprite_slice]
+        return frame
+
+    def still_frames(self, frame, first_frame, count, frame_rate):
+        """Yield count frames of a static image, redrawing only when the caption changes."""
+        state = captioned = object()
+        for k in range(count):
+            new_state = self.state_at((first_frame + k) / frame_rate)
+            if new_state != state:
+                state = new_state
+                captioned = self.draw(frame.copy(), state)
+            yield captioned
+
+    def _sprite(self, text, highlighted):
+        key = (text, highlighted)
+        if key not in self.sprites:
+            self.sprites[key] = self._rasterize(text, highlighted)
+        return self.sprites[key]
+
+    def _rasterize(self, text, highlighted):
+        style = self.style
+        stroke = style["stroke_width"]
+        width = int(np.ceil(self.font.getlength(text))) + 2 * self.margin
+        height = self.line_height + 2 * self.margin
+        origin = (self.margin, self.margin + stroke)
+
+        sprite = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+        if self.shadow_radius:
+            # Blurred silhouette of the stroked text underneath the glyphs
+            silhouette = Image.new("L", (width, height), 0)
+            ImageDraw.Draw(silhouette).text(origin, text, font=self.font, fill=255, stroke_width=stroke, stroke_fill=255)
+            silhouette = silhouette.filter(ImageFilter.GaussianBlur(self.shadow_radius))
+            strength = min(max(style["shadow_strength"], 0.0), 1.0)
+            silhouette = silhouette.point(lambda value: int(value * strength))
+            sprite.paste((0, 0, 0, 255), (0, 0), silhouette)
+
+        fill = style["word_highlight_color"] if highlighted else style["font_color"]
+        glyphs = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+        ImageDraw.Draw(glyphs).text(origin, text, font=self.font, fill=fill, stroke_width=stroke, stroke_fill=style["stroke_color"])
+        sprite = Image.alpha_composite(sprite, glyphs)
+
+        rgba = np.asarray(sprite, dtype=np.float32)
+        alpha = rgba[:, :, 3:4] / 255.0
+        premultiplied = rgba[:, :, 2::-1] * alpha  # RGB -> BGR
+        return np.ascontiguousarray(premultiplied), 1.0 - alpha
+
+def _ass_color(color, alpha=0):
+    r, g, b = ImageColor.getrgb(color)[:3]
+    return f"&H{alpha:02X}{b:02X}{g:02X}{r:02X}"
+
+def _ass_time(seconds):
+    centiseconds = max(0, int(round(seconds * 100)))
+    hours, rest = divmod(centiseconds, 360000)
+    minutes, rest = divmod(rest, 6000)
+    secs, cs = divmod(rest, 100)
+    return f"{hours}:{minutes:02d}:{secs:02d}.{cs:02d}"
+
+def _ass_text(text):
+    return text.replace("\\", "/").replace("{", "(").replace("}", ")")
+
+def write_ass(captions, path, style, width, height):
+    """Write captions as an ASS subtitle file for ffmpeg's subtitles filter.
+
+    The script resolution matches the video so sizes and padding are in
+    pixels. Word highlighting is emitted as one event per word with a colour
+    override on the current word.
+    """
+    try:
+        font_name = ImageFont.truetype(style["font"], style["font_size"]).getname()[0]
+    except OSError:
+        font_name = os.path.splitext(os.path.basename(style["font"]))[0]
+    primary = _ass_color(style["font_color"])
+    highlight = _ass_color(style["word_highlight_color"])
+    shadow_alpha = int(255 * (1 - min(max(style["shadow_strength"], 0.0), 1.0)))
+    shadow_depth = 2 if style["shadow_strength"] > 0 else 0
+
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {width}",
+        f"PlayResY: {height}",
+        "WrapStyle: 2",
+        "ScaledBorderAndShadow: yes",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+        "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, "
+        "Shadow, Alignment, MarginL, MarginR, MarginV, Encoding",
+        f"Style: Default,{font_name},{style['font_size']},{primary},{primary},"
+        f"{_ass_color(style['stroke_color'])},{_ass_color('black', shadow_alpha)},"
+        f"0,0,0,0,100,100,0,0,1,{style['stroke_width']},{shadow_depth},5,"
+        f"{style['padding']},{style['padding']},0,1",
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+
+    for caption in captions:
+        words = [word for line in caption["lines"] for word in line]
+        if not style["highlight_current_word"]:
+            text = "\\N".join(" ".join(_ass_text(w["text"]) for w in line) for line in caption["lines"])
+            lines.append(f"Dialogue: 0,{_ass_time(caption['start'])},{_ass_time(caption['end'])},Default,,0,0,0,,{text}")
+            continue
+        for k, current in enumerate(words):
+            start = caption["start"] if k == 0 else current["start"]
+            end = words[k + 1]["start"] if k + 1 < len(words) else caption["end"]
+            if end <= start:
+                continue
+            rendered = []
+            for line in caption["lines"]:
+                parts = []
+                for word in line:
+                    text = _ass_text(word["text"])
+                    if word is current:
+                        text = f"{{\\1c{highlight}}}{text}{{\\1c{primary}}}"
+                    parts.append(text)
+                rendered.append(" ".join(parts))
+            text = "\\N".join(rendered)
+            lines.append(f"Dialogue: 0,{_ass_time(start)},{_ass_time(end)},Default,,0,0,0,,{text}")
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
@@ -0,0 +1,114 @@
+import subprocess
+import tempfile
+
+# Narration is always delivered as AAC, matching what add_narration_to_video and reprocess_video produce
+AUDIO_CODEC_ARGS = ['-c:a', 'aac', '-b:a', '192k', '-ar', '44100']
+
+
+# x264's own defaults; used when settings do not define the requested profile
+DEFAULT_PROFILE = {"preset": "medium", "crf": 23, "faststart": True}
+
+
+def encoder_profile(settings, name=None):
+    """Resolve a named encoder profile from settings["encoding"].
+
+    Profiles may set preset, crf, tune (e.g. "stillimage"), threads, gop and
+    faststart. The profile named by settings["encoding"]["profile"] is used
+    unless a name is given explicitly.
+    """
+    encoding_settings = (settings or {}).get("encoding", {})
+    name = name or encoding_settings.get("profile", "default")
+    profiles = encoding_settings.get("profiles", {})
+    if name not in profiles and name != "default":
+        print(f"Warning: Encoder profile '{name}' not found in settings. Using x264 defaults.")
+    return {**DEFAULT_PROFILE, **profiles.get(name, {})}
+
+
+def video_codec_args(settings, profile_name=None):
+    """ffmpeg output options for the H.264 stream of a rendered short.
+
+    Every segment of a short must be encoded with the same options so the
+    pieces can be stream-copied together by the concat demuxer.
+    """
+    profile = encoder_profile(settings, profile_name)
+    args = ['-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-preset', str(profile["preset"]), '-crf', str(profile["crf"])]
+    if profile.get("tune"):
+        args += ['-tune', str(profile["tune"])]
+    if profile.get("threads") is not None:
+        args += ['-threads', str(profile["threads"])]
+    if profile.get("gop"):
+        args += ['-g', str(profile["gop"])]
+    return args
+
+
+def container_args(settings, profile_name=None):
+    """MP4 muxer options for the final file of a short."""
+    if encoder_profile(settings, profile_name).get("faststart"):
+        # Move the moov atom to the front so uploads and players can start before the whole file arrives
+        return ['-movflags', '+faststart']
+    return []
+
+
+class FFmpegWriter:
+    """Stream raw BGR frames into an ffmpeg process.
+
+    Mirrors the parts of cv2.VideoWriter that video.create uses (write,
+    isOpened, release) so the frame loop does not care which sink it has.
+    Extra inputs (audio, subtitles) and output options are passed straight
+    through to ffmpeg, which lets one process mux and encode everything.
+    """
+
+    def __init__(self, output_file, frame_rate, size, input_args=None, output_args=None):
+        width, height = size
+        self.output_file = output_file
+        self.command = [
+            'ffmpeg',
+            '-y',
+            '-loglevel', 'error',
+            '-f', 'rawvideo',
+            '-pix_fmt', 'bgr24',
+            '-s', f'{width}x{height}',
+            '-framerate', str(frame_rate),
+            '-i', 'pipe:0',
+            *(input_args or []),
+            *(output_args or []),
+            output_file,
+        ]
+        # Spool stderr to a file so a chatty ffmpeg can never block on a full pipe
+        self._stderr = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stderr=self._stderr,
+        )
+
+    def isOpened(self):
+        return self.process.poll() is None
+
+    def write(self, frame):
+        try:
+            self.process.stdin.write(memoryview(frame))
+        except BrokenPipeError:
+            self.process.wait()
+            raise RuntimeError(f"ffmpeg exited while encoding {self.output_file}: {self._error_text()}")
+
+    def release(self):
+        if self.process.stdin and not self.process.stdin.closed:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+        returncode = self.process.wait()
+        error_text = self._error_text()
+        self._stderr.close()
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg failed to encode {self.output_file}: {error_text}")
+
+    def _error_text(self):
+        self._stderr.seek(0)
+        return self._stderr.read().decode(errors="replace").strip()[-2000:]
+
+
+def filter_path(path):
+    """Escape a file path for use as an option value inside an ffmpeg filtergraph."""
+    return path.replace('\\', '\\\\').replace(':', '\\:').replace("'", "\\'")
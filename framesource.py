@@ -0,0 +1,74 @@
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+
+
+def load_scene_image(output_dir, index, width, height):
+    """Read images/image_<index>.png resized to the frame size, or None if it is missing."""
+    image = cv2.imread(os.path.join(output_dir, "images", f"image_{index}.png"))
+    if image is None:
+        return None
+    if image.shape[1] != width or image.shape[0] != height:
+        image = cv2.resize(image, (width, height))
+    return image
+
+
+class SceneImages:
+    """Decoded, frame-sized scene images with a small LRU and a background prefetcher.
+
+    The render loop asks for scene i while scene i+1 is already being decoded
+    on a worker thread (cv2 releases the GIL while decoding and resizing), so
+    writing frames never waits on PNG decode. Every image is decoded once even
+    though each scene is used both as "current" and as the previous scene's
+    "next" image.
+    """
+
+    def __init__(self, output_dir, width, height, capacity=3):
+        self.output_dir = output_dir
+        self.width = width
+        self.height = height
+        self.capacity = capacity
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="scene-prefetch")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get(self, index):
+        """Return the image for scene index (1-based), or None if it does not exist."""
+        if index in self._cache:
+            self._cache.move_to_end(index)
+            return self._cache[index]
+        future = self._pending.pop(index, None)
+        if future is not None:
+            image = future.result()
+        else:
+            image = load_scene_image(self.output_dir, index, self.width, self.height)
+        self._store(index, image)
+        return image
+
+    def prefetch(self, index):
+        """Start decoding scene index in the background if it is not already available."""
+        if index in self._cache or index in self._pending:
+            return
+        self._pending[index] = self._executor.submit(
+            load_scene_image, self.output_dir, index, self.width, self.height
+        )
+
+    def close(self):
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        self._executor.shutdown(wait=True)
+        self._cache.clear()
+
+    def _store(self, index, image):
+        self._cache[index] = image
+        self._cache.move_to_end(index)
+        while len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
@@ -1,10 +1,17 @@
-from openai import OpenAI
 import requests
-import base64
+import cache
+import pipeline
+import binascii
 import os
 import json
 import cv2
+import numpy as np
 import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
 # Set a different seed for each concurrent request
 unique_seed = random.randint(1, 1_000_000)
@@ -29,211 +36,432 @@ except ValueError:
     IMAGE_API_TIMEOUT = 300.0
 # API kind: 'form' (sd-api style) or 'json' (A1111 style). Default 'form'.
 IMAGE_API_KIND = os.getenv("IMAGE_API_KIND", "form").lower()
+# Attempts per scene for connection errors, timeouts and 429/5xx responses
+try:
+    IMAGE_API_RETRIES = max(1, int(os.getenv("IMAGE_API_RETRIES", "4")))
+except ValueError:
+    IMAGE_API_RETRIES = 4
+# Base delay in seconds for exponential backoff between attempts
+try:
+    IMAGE_API_BACKOFF = float(os.getenv("IMAGE_API_BACKOFF", "2"))
+except ValueError:
+    IMAGE_API_BACKOFF = 2.0
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Accept header for txt2img; set to image/png if the API can answer with the raw PNG instead of JSON
+IMAGE_API_ACCEPT = os.getenv("IMAGE_API_ACCEPT", "application/json")
+# Size of the pieces responses are streamed in
+STREAM_CHUNK_SIZE = 256 * 1024
+# Size budget of the shared generated-image cache; 0 disables it
+try:
+    IMAGE_CACHE_MAX_MB = float(os.getenv("IMAGE_CACHE_MAX_MB", "2048"))
+except ValueError:
+    IMAGE_CACHE_MAX_MB = 2048.0
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Shared keep-alive session so every request reuses pooled connections to the image API."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+def request_with_retry(method, url, description, **kwargs):
+    """Send a request, retrying transient failures with jittered exponential backoff.
+
+    Returns the final response (which may still be an error status) or raises
+    the last connection error once IMAGE_API_RETRIES attempts are used up.
+    """
+    for attempt in range(1, IMAGE_API_RETRIES + 1):
+        try:
+            response = get_session().request(method, url, **kwargs)
+            if response.status_code not in RETRY_STATUS_CODES or attempt == IMAGE_API_RETRIES:
+                return response
+            reason = f"status {response.status_code}"
+            # Hand the connection back to the pool before retrying a streamed response
+            response.close()
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt == IMAGE_API_RETRIES:
+                raise
+            reason = type(e).__name__
+        # Full jitter keeps concurrent scenes from retrying in lockstep
+        delay = random.uniform(0, IMAGE_API_BACKOFF * 2 ** (attempt - 1))
+        print(f"Retrying {description} in {delay:.1f}s after {reason} (attempt {attempt}/{IMAGE_API_RETRIES})...")
+        time.sleep(delay)
+
+# Keys in settings["image"] that configure this client and must not be forwarded to the image API
+CLIENT_SETTINGS = ("concurrency",)
 
 def create_from_data(data, output_dir, caption_settings=None):
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    jobs = ImageJobs(output_dir, caption_settings)
+    for item in data["scenes"]:
+            if "image" in item:
+                jobs.submit(item)
+    jobs.finish()
+
+class ImageJobs:
+    """Generate scene images as scenes become known, numbering them in submission order.
 
-        # Define a separate directory for storing prompt JSON files
-    prompt_log_dir = os.path.join(output_dir, "prompts")
-    if not os.path.exists(prompt_log_dir):
-        os.makedirs(prompt_log_dir)
+    create_from_data submits a whole script at once; the streaming script
+    parser submits each [image] scene while the LLM is still writing the rest.
+    Up to settings["image"]["concurrency"] txt2img requests are in flight.
+    """
 
-    # Get image settings from caption_settings
-    image_settings = caption_settings.get("image", {}) if caption_settings else {}
-    model = image_settings.get("model", "dall-e-3")
+    def __init__(self, output_dir, caption_settings=None):
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+            # Define a separate directory for storing prompt JSON files
+        self.prompt_log_dir = os.path.join(output_dir, "prompts")
+        if not os.path.exists(self.prompt_log_dir):
+            os.makedirs(self.prompt_log_dir)
+
+        self.output_dir = output_dir
+        # Get image settings from caption_settings
+        self.image_settings = caption_settings.get("image", {}) if caption_settings else {}
+        self.orientation = self.image_settings.get("orientation", "1024x1024")
+        # Images are stored at the video frame size so rendering never resizes them
+        video_settings = caption_settings.get("video", {}) if caption_settings else {}
+        self.frame_size = (video_settings.get("width", 720), video_settings.get("height", 1280))
+        # Number of txt2img requests kept in flight; the API queues them on its side
+        concurrency = max(1, int(self.image_settings.get("concurrency", 1)))
+        self.pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="txt2img")
+        self.futures = []
+
+    def submit(self, item):
+        """Queue the image for one scene and return its image number."""
+        image_number = len(self.futures) + 1
+        request = build_request(item, self.image_settings)
+        with open(os.path.join(self.prompt_log_dir, f"prompt_{image_number}.json"), "w") as json_file:
+            json.dump(
+                {
+                    "endpoint": f"{IMAGE_API_BASE_URL.rstrip('/')}/txt2img",
+                    "payload": request["payload"],
+                    },
+                    json_file,
+                    indent=2,
+                )
+        self.futures.append(self.pool.submit(
+            generate_cached_image, image_number, request, self.output_dir, self.orientation, self.frame_size
+        ))
+        return image_number
+
+    def cancel(self):
+        """Drop queued images; requests already in flight are left to finish."""
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def finish(self):
+        """Wait for every submitted image; raises if any scene is still missing its image."""
+        try:
+            results = [future.result() for future in self.futures]
+        finally:
+            self.pool.shutdown(wait=True)
+
+        if IMAGE_CACHE_MAX_MB > 0:
+            removed = cache.evict(cache.cache_dir("images"), int(IMAGE_CACHE_MAX_MB * 1024 * 1024))
+            if removed:
+                print(f"Evicted {removed} least recently used images from the image cache.")
+
+        # Every scene has had its own retries; fail here rather than in video.create
+        failed = [image_number for image_number, ok in enumerate(results, start=1) if not ok]
+        if failed:
+            raise RuntimeError(f"Image generation failed for scene(s) {', '.join(map(str, failed))}.")
+
+def build_request(item, image_settings):
+    """Build the txt2img payload, headers and requests kwargs for one scene."""
     # size = image_settings.get("size", "1024x1024")
-    width = image_settings.get("width", 1024)
-    height = image_settings.get("height", 1024)
-    orientation = image_settings.get("orientation", "1024x1024")
-    quality = image_settings.get("quality", "standard")
-    n = image_settings.get("n", 1)
-    # subject = image_settings.get("subject", "Cro-Magnons")
     effect = image_settings.get("effect", "Cinematic")
     prompt_size = image_settings.get("prompt_size", "small")
     neg2 = image_settings.get("negative", "multiple heads, multiple horns, extra limbs, missing limbs, fused features, disproportionate anatomy, symmetrical errors, unnatural joints, overly smooth textures, low-quality rendering, floating body parts, deformed anatomy, cartoonish, cgi, painting, unnatural poses, awkward jumps, gravity-defying, watermark, text, signature")
-    size = str(width) + 'x' + str(height)
-    image_counter = 1  # Initialize a counter for saved images
 
-    for item in data["scenes"]:
-            if "image" in item:
-                art_style = item.get("art_style", {})
-                # style_name = art_style.get("name", "").strip()
-                style_characteristics = art_style.get("characteristics", [])
-                neg = neg2
-                neg += art_style.get("negative", "").strip()
-
-                # Orientation and Effect Handling
-                style_prompt = f" {effect.lower()}, "
-                # style_prompt += "The scene embodies the following artistic characteristics: "
-
-                # Extract characteristics dynamically with proper sentence structure
-                characteristic_texts = []
-                if prompt_size == "small":
-                    char = style_characteristics[0]
-                    char_desc = char.get("description", "").strip()
-                    characteristic_texts.append(f"{char_desc}")
-                else:
-                    for char in style_characteristics:
-                        if isinstance(char, dict):
-                            # char_name = char.get("name", "").strip()
-                            char_desc = char.get("description", "").strip()
-                            # characteristic_texts.append(f"{char_name} – {char_desc}")
-                            characteristic_texts.append(f"{char_desc}")
-                
-                # Join characteristics efficiently
-                style_prompt += ", ".join(characteristic_texts)
-
-                # Constructing the final full prompt
-                full_prompt = (
-                        f"{item['image']}, {style_prompt}"
-                        # f"The composition is dynamic, with natural movement to capture attention. The scene evokes an educational and narrative element, as if from a storybook. "
-                        # f"Cinematic lighting, National Geographic quality, ultra-sharp details, volumetric shadows, vibrant colors."
-                    )
-
-                # Negative prompt to avoid distortions
-                # negative_prompt = f"{neg}"
-
-                # Build payload based on configured API kind
-                if IMAGE_API_KIND == "form":
-                    # Minimal fields as used by sd-api example
-                    request_payload = {
-                        "prompt": full_prompt,
-                        "negative_prompt": neg,
-                        "width": image_settings.get("width", 512),
-                        "height": image_settings.get("height", 512),
-                        "steps": image_settings.get("steps", 28),
-                        "guidance": image_settings.get("guidance", image_settings.get("cfg_scale", 7.0)),
-                    }
-                    request_headers = {
-                        "accept": "application/json",
-                        "Content-Type": "application/x-www-form-urlencoded",
-                    }
-                    request_kwargs = {"data": request_payload}
-                else:
-                    # JSON payload compatible with A1111
-                    request_payload = dict(image_settings)
-                    # Do not alter the structure or existing values except prompt/negative_prompt
-                    request_payload['prompt'] = full_prompt
-                    request_payload['negative_prompt'] = neg
-                    request_headers = {"accept": "application/json"}
-                    request_kwargs = {"json": request_payload}
-                # API request payload
-                # request_payload = {
-                #     "prompt": full_prompt,
-                #     "negative_prompt": neg,
-                #     "model": image_settings.get("model", "v1-5-pruned-emaonly.safetensors"),
-                #     "width": image_settings.get("width", 768),
-                #     "height": image_settings.get("height", 768),
-                #     "steps": image_settings.get("steps", 30),
-                #     "cfg_scale": image_settings.get("cfg_scale", 7.0),
-                #     "sampler_index":image_settings.get("sampler_index", "DPM++ 2M"),
-                #     "seed": unique_seed,
-                #     "batch_size": image_settings.get("batch_size", 1),
-                #     "batch_count": image_settings.get("batch_count", 6),
-                #     "enable_hr": image_settings.get("enable_hr", False),
-                #     "hr_scale": image_settings.get("hr_scale", 1.0),
-                #     "hr_upscaler": image_settings.get("hr_upscaler", "4x-UltraSharp"),
-                #     "denoising_strength": image_settings.get("denoising_strength", 0.5),
-                #     "refiner_checkpoint": image_settings.get("refiner_checkpoint", "sd_xl_refiner_1.0.safetensors"),
-                #     "refiner_switch_at": image_settings.get("refiner_switch_at", 0.6),
-                #     "model_hash": image_settings.get("model_hash", "31e35c80fc"),
-                #     "version": image_settings.get("version", "v1.10.1")
-                #     }
-
-                with open(os.path.join(prompt_log_dir, f"prompt_{image_counter}.json"), "w") as json_file:
-                    json.dump(
-                        {
-                            "endpoint": f"{IMAGE_API_BASE_URL.rstrip('/')}/txt2img",
-                            "payload": request_payload,
-                            },
-                            json_file,
-                            indent=2,
-                        )
-
-                # Send request to Stable Diffusion API
-                try:
-                    response = requests.post(
-                        f"{IMAGE_API_BASE_URL.rstrip('/')}/txt2img",
-                        headers=request_headers,
-                        timeout=(10, IMAGE_API_TIMEOUT),
-                        **request_kwargs,
-                    )
-                except requests.exceptions.ReadTimeout:
-                    print(
-                        f"Error: Image API timed out after {IMAGE_API_TIMEOUT}s: "
-                        f"{IMAGE_API_BASE_URL.rstrip('/')}/txt2img"
-                    )
-                    image_counter += 1
-                    continue
-
-                # Check if the request was successful
-                if response.status_code == 200:
-                    response_data = response.json()
-                    image_bytes = None
-
-                    # Case 1: Automatic1111-style base64 response
-                    if isinstance(response_data, dict) and 'images' in response_data:
-                        image_data = response_data['images'][0]
-                        image_bytes = base64.b64decode(image_data)
-
-                    # Case 2: URL-based response { ok, path, url }
-                    elif isinstance(response_data, dict) and response_data.get('ok') and response_data.get('url'):
-                        file_url = response_data['url']
-                        img_resp = requests.get(file_url, timeout=120)
-                        if img_resp.status_code == 200:
-                            image_bytes = img_resp.content
-                        else:
-                            print(f"Error: Failed to download image from {file_url}.")
-
-                    if image_bytes is None:
-                        # Print any error message from server response
-                        if isinstance(response_data, dict):
-                            err_msg = response_data.get('error') or response_data.get('detail')
-                            if err_msg:
-                                print(f"Image API error detail: {err_msg}")
-                        print("Error: Unexpected image API response format.")
-                        image_counter += 1
-                        continue
-
-                    temp_path = os.path.join(output_dir, "temp.png")
-                    with open(temp_path, "wb") as f:
-                        f.write(image_bytes)
-
-                    if orientation == "portrait":
-                        # Load and resize to 1792x1792
-                        img = cv2.imread(temp_path)
-                        img_resized = cv2.resize(img, (1792, 1792))
-                        
-                        # Get the center crop coordinates (1024x1792 from 1792x1792)
-                        height, width = img_resized.shape[:2]
-                        start_x = (width - 1024) // 2
-                        end_x = start_x + 1024
-                        
-                        # Perform the center crop
-                        cropped_img = img_resized[:, start_x:end_x]
-                        
-                        # Save the final cropped image
-                        cv2.imwrite(os.path.join(output_dir, f"image_{image_counter}.png"), cropped_img)
-                        
-                        # Clean up temporary file
-                        os.remove(temp_path)
-                    else:
-                        # Save the image directly for non-portrait orientations
-                        with open(os.path.join(output_dir, f"image_{image_counter}.png"), "wb") as f:
-                            f.write(image_bytes)
-                else:
-                    # Log more detail to help diagnose 4xx/5xx
-                    try:
-                        err_text = response.text[:500]
-                    except Exception:
-                        err_text = "<no response body>"
-                    print(
-                        f"Error: Failed to generate image. Status code: {response.status_code}. "
-                        f"Endpoint: {IMAGE_API_BASE_URL.rstrip('/')}/txt2img. Response: {err_text}"
-                    )
-
-                image_counter += 1
+    art_style = item.get("art_style", {})
+    # style_name = art_style.get("name", "").strip()
+    style_characteristics = art_style.get("characteristics", [])
+    neg = neg2
+    neg += art_style.get("negative", "").strip()
+
+    # Orientation and Effect Handling
+    style_prompt = f" {effect.lower()}, "
+    # style_prompt += "The scene embodies the following artistic characteristics: "
+
+    # Extract characteristics dynamically with proper sentence structure
+    characteristic_texts = []
+    if prompt_size == "small":
+        char = style_characteristics[0]
+        char_desc = char.get("description", "").strip()
+        characteristic_texts.append(f"{char_desc}")
+    else:
+        for char in style_characteristics:
+            if isinstance(char, dict):
+                # char_name = char.get("name", "").strip()
+                char_desc = char.get("description", "").strip()
+                # characteristic_texts.append(f"{char_name} – {char_desc}")
+                characteristic_texts.append(f"{char_desc}")
+
+    # Join characteristics efficiently
+    style_prompt += ", ".join(characteristic_texts)
+
+    # Constructing the final full prompt
+    full_prompt = (
+            f"{item['image']}, {style_prompt}"
+            # f"The composition is dynamic, with natural movement to capture attention. The scene evokes an educational and narrative element, as if from a storybook. "
+            # f"Cinematic lighting, National Geographic quality, ultra-sharp details, volumetric shadows, vibrant colors."
+        )
+
+    # Build payload based on configured API kind
+    if IMAGE_API_KIND == "form":
+        # Minimal fields as used by sd-api example
+        request_payload = {
+            "prompt": full_prompt,
+            "negative_prompt": neg,
+            "width": image_settings.get("width", 512),
+            "height": image_settings.get("height", 512),
+            "steps": image_settings.get("steps", 28),
+            "guidance": image_settings.get("guidance", image_settings.get("cfg_scale", 7.0)),
+        }
+        request_headers = {
+            "accept": IMAGE_API_ACCEPT,
+            "Content-Type": "application/x-www-form-urlencoded",
+        }
+        request_kwargs = {"data": request_payload}
+    else:
+        # JSON payload compatible with A1111
+        request_payload = {key: value for key, value in image_settings.items() if key not in CLIENT_SETTINGS}
+        # Do not alter the structure or existing values except prompt/negative_prompt
+        request_payload['prompt'] = full_prompt
+        request_payload['negative_prompt'] = neg
+        request_headers = {"accept": IMAGE_API_ACCEPT}
+        request_kwargs = {"json": request_payload}
+
+    return {"payload": request_payload, "headers": request_headers, "kwargs": request_kwargs}
+
+def fit_to_frame(image, frame_size, crop=True):
+    """Scale an image to the video frame size in a single resize.
+
+    With crop, the image is scaled to cover the frame and centre-cropped
+    (portrait output from a square render); otherwise it is stretched to the
+    frame, which is what the renderer did with uncropped images.
+    """
+    width, height = frame_size
+    image_height, image_width = image.shape[:2]
+    if (image_width, image_height) == (width, height):
+        return image
+    if not crop:
+        interpolation = cv2.INTER_AREA if image_width * image_height > width * height else cv2.INTER_CUBIC
+        return cv2.resize(image, (width, height), interpolation=interpolation)
+
+    scale = max(width / image_width, height / image_height)
+    scaled_width = max(width, round(image_width * scale))
+    scaled_height = max(height, round(image_height * scale))
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+    scaled = cv2.resize(image, (scaled_width, scaled_height), interpolation=interpolation)
+    start_x = (scaled_width - width) // 2
+    start_y = (scaled_height - height) // 2
+    return scaled[start_y:start_y + height, start_x:start_x + width]
+
+def generate_cached_image(image_number, request, output_dir, orientation, frame_size):
+    """Reuse a previously generated image for an identical request, otherwise generate and cache it.
+
+    The key covers the API kind, endpoint, the full payload (model, size,
+    steps, guidance, seed, ...) and the post-processing applied locally.
+    """
+    if IMAGE_CACHE_MAX_MB <= 0:
+        with pipeline.resource("gpu"):
+            return generate_image(image_number, request, output_dir, orientation, frame_size)
+
+    key = cache.content_key(IMAGE_API_KIND, f"{IMAGE_API_BASE_URL.rstrip('/')}/txt2img", request["payload"], orientation, list(frame_size))
+    entry_path = os.path.join(cache.cache_dir("images"), f"{key}.png")
+    image_path = os.path.join(output_dir, f"image_{image_number}.png")
+    if cache.fetch_file(entry_path, image_path):
+        print(f"Image {image_number} reused from cache.")
+        return True
+
+    # txt2img is the GPU-bound step; cache hits above never wait for a slot
+    with pipeline.resource("gpu"):
+        ok = generate_image(image_number, request, output_dir, orientation, frame_size)
+    if ok:
+        cache.store_file(image_path, entry_path)
+    return ok
+
+def read_body(response):
+    """Stream a response body into one buffer, sized up front when the length is known."""
+    buffer = bytearray()
+    length = response.headers.get("Content-Length")
+    if length and length.isdigit():
+        # Reserve the final size so growing the buffer never copies it
+        buffer = bytearray(int(length))
+        view = memoryview(buffer)
+        filled = 0
+        for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+            if filled + len(chunk) > len(buffer):
+                buffer.extend(bytes(filled + len(chunk) - len(buffer)))
+                view = memoryview(buffer)
+            view[filled:filled + len(chunk)] = chunk
+            filled += len(chunk)
+        view.release()
+        del buffer[filled:]
+        return buffer
+    for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+        buffer += chunk
+    return buffer
+
+class Base64ImageStream:
+    """Incrementally pull the first image out of an A1111-style {"images": ["<base64>", ...]} body.
+
+    The base64 text is decoded as it arrives, so the response is never held
+    as a JSON string plus a decoded copy. Everything outside the image string
+    is kept so small error or URL-style bodies can still be parsed as JSON.
+    """
+
+    MARKER = re.compile(rb'"images"\s*:\s*\[?\s*')
+
+    def __init__(self):
+        self.rest = bytearray()
+        self.image = None
+        self._state = "search"
+        self._pending = b""
+
+    def feed(self, chunk):
+        if self._state == "search":
+            self.rest += chunk
+            match = self.MARKER.search(self.rest)
+            if match is None or match.end() == len(self.rest):
+                return
+            if self.rest[match.end()] != ord('"'):
+                # "images" is empty or not a list of strings
+                self._state = "done"
+                return
+            chunk = bytes(self.rest[match.end() + 1:])
+            del self.rest[match.end() + 1:]
+            self.image = bytearray()
+            self._state = "data"
+        if self._state == "data":
+            end = chunk.find(b'"')
+            data = chunk if end < 0 else chunk[:end]
+            # JSON encoders may escape "/" as "\/"
+            data = self._pending + data.replace(b"\\", b"")
+            usable = len(data) - len(data) % 4
+            self.image += binascii.a2b_base64(data[:usable])
+            self._pending = data[usable:]
+            if end < 0:
+                return
+            if self._pending:
+                self.image += binascii.a2b_base64(self._pending + b"=" * (-len(self._pending) % 4))
+            self.rest += chunk[end:]
+            self._state = "done"
+        else:
+            self.rest += chunk
+
+def read_image_response(response, image_number):
+    """Return the encoded image bytes from a successful txt2img response, or None.
+
+    Handles a raw image body, A1111 base64 JSON (decoded while streaming) and
+    {ok, path, url} JSON, whose file is then downloaded in chunks.
+    """
+    content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+    # Case 1: binary image/png response
+    if content_type.startswith("image/"):
+        return read_body(response)
+
+    stream = Base64ImageStream()
+    for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+        stream.feed(chunk)
+    # Case 2: Automatic1111-style base64 response
+    if stream.image:
+        return stream.image
+
+    try:
+        response_data = json.loads(bytes(stream.rest))
+    except ValueError:
+        response_data = None
+
+    # Case 3: URL-based response { ok, path, url }
+    if isinstance(response_data, dict) and response_data.get('ok') and response_data.get('url'):
+        file_url = response_data['url']
+        try:
+            img_resp = request_with_retry("GET", file_url, f"download of image {image_number}", timeout=120, stream=True)
+            try:
+                if img_resp.status_code == 200:
+                    return read_body(img_resp)
+            finally:
+                img_resp.close()
+            print(f"Error: Failed to download image from {file_url}.")
+        except requests.exceptions.RequestException as e:
+            print(f"Error: Failed to download image from {file_url}: {e}")
+        return None
+
+    # Print any error message from server response
+    if isinstance(response_data, dict):
+        err_msg = response_data.get('error') or response_data.get('detail')
+        if err_msg:
+            print(f"Image API error detail: {err_msg}")
+    print(f"Error: Unexpected image API response format for image {image_number}.")
+    return None
+
+def generate_image(image_number, request, output_dir, orientation, frame_size):
+    """Send one txt2img request and save the result as image_<image_number>.png; returns True on success."""
+    # Send request to Stable Diffusion API
+    try:
+        response = request_with_retry(
+            "POST",
+            f"{IMAGE_API_BASE_URL.rstrip('/')}/txt2img",
+            f"image {image_number}",
+            headers=request["headers"],
+            timeout=(10, IMAGE_API_TIMEOUT),
+            stream=True,
+            **request["kwargs"],
+        )
+    except requests.exceptions.Timeout:
+        print(
+            f"Error: Image API timed out after {IMAGE_API_TIMEOUT}s for image {image_number}: "
+            f"{IMAGE_API_BASE_URL.rstrip('/')}/txt2img"
+        )
+        return False
+    except requests.exceptions.ConnectionError as e:
+        print(f"Error: Could not reach image API for image {image_number}: {e}")
+        return False
+
+    # Check if the request was successful
+    if response.status_code == 200:
+        try:
+            image_bytes = read_image_response(response, image_number)
+        except requests.exceptions.RequestException as e:
+            print(f"Error: Image API response for image {image_number} was interrupted: {e}")
+            return False
+        except binascii.Error as e:
+            print(f"Error: Image API returned invalid base64 for image {image_number}: {e}")
+            return False
+        finally:
+            response.close()
+        if image_bytes is None:
+            return False
+
+        image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            print(f"Error: Image API returned data that could not be decoded for image {image_number}.")
+            return False
+
+        image = fit_to_frame(image, frame_size, crop=orientation == "portrait")
+        # Low compression keeps the PNG cheap to write and to decode again in video.create
+        cv2.imwrite(os.path.join(output_dir, f"image_{image_number}.png"), image, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+        print(f"Image {image_number} saved.")
+        return True
+    else:
+        # Log more detail to help diagnose 4xx/5xx
+        try:
+            err_text = response.text[:500]
+        except Exception:
+            err_text = "<no response body>"
+        print(
+            f"Error: Failed to generate image {image_number}. Status code: {response.status_code}. "
+            f"Endpoint: {IMAGE_API_BASE_URL.rstrip('/')}/txt2img. Response: {err_text}"
+        )
+        return False
 
 # def generate(prompt, output_file, size="1024x1792"):
 #     response = client.images.generate(
@@ -1,18 +1,21 @@
 #!/usr/bin/env python3
 
+import time
+_module_started = time.perf_counter()
+
 import csv
+import functools
+import importlib
 import json
 import os
 import sys
-import time
 from dotenv import load_dotenv
 import random
-import narration
-import images
-import video
-from openai import OpenAI
-import upload
+import threading
+import traceback
+import uuid
 import ollama
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from animalscript import get_new_animals, create_animal_scripts
@@ -20,9 +23,42 @@ from animalscript import get_new_animals, create_animal_scripts
 # All media outputs write to the bind-mounted host videos directory
 OUTPUT_ROOT = "/videos"
 ANIMAL_CSV_PATH = Path("animal_names.csv")
+# Batch workers finish in any order; appends to animal_names.csv take turns
+_animal_csv_lock = threading.Lock()
 
 # Globals configured during startup
 ollama_client = None
+NARRATION_MODEL = 'mistral'  # or whatever model you want to use
+
+# Heavy pipeline modules (cv2, MoviePy, Whisper, Google API client) are imported by lazy_import
+# when their stage first runs; --import-times prints how long each one took
+REPORT_IMPORT_TIMES = False
+import_times = {}
+# --draft renders a quick preview using the overrides in settings["draft"]
+DRAFT = False
+
+
+def lazy_import(name):
+    """Import a pipeline module on first use, recording how long the import took."""
+    # Always go through import_module: a module another short's thread is still
+    # importing is already in sys.modules, and the import lock waits for it
+    first_import = name not in sys.modules
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    if first_import:
+        import_times.setdefault(name, time.perf_counter() - started)
+    return module
+
+
+def print_import_times():
+    """Print lazily imported modules by import cost, like a condensed -X importtime."""
+    startup = import_times.get("<startup>")
+    print("Import times:")
+    if startup is not None:
+        print(f"  {startup * 1000:9.1f} ms  main.py startup")
+    for name, seconds in sorted(import_times.items(), key=lambda item: item[1], reverse=True):
+        if name != "<startup>":
+            print(f"  {seconds * 1000:9.1f} ms  {name}")
 
 
 def initialize_environment():
@@ -43,22 +79,37 @@ def initialize_environment():
 # Resolve project paths relative to this file
 BASE_DIR = Path(__file__).resolve().parent
 
-art_styles_candidates = [
-    BASE_DIR / "instructions" / "art-styles.json",
-    Path.cwd() / "instructions" / "art-styles.json",
-    Path("/instructions/art-styles.json"),
-]
-for candidate in art_styles_candidates:
-    if candidate.exists():
-        art_styles_path = candidate
-        break
-else:
-    raise FileNotFoundError(
-        "instructions/art-styles.json not found. Checked: "
-        + ", ".join(str(p) for p in art_styles_candidates)
-    )
-with open(art_styles_path) as f:
-    art_styles = json.load(f)["art_movements"]
+
+@functools.lru_cache(maxsize=None)
+def load_art_styles():
+    """Parse instructions/art-styles.json once, the first time a scene needs an art style."""
+    art_styles_candidates = [
+        BASE_DIR / "instructions" / "art-styles.json",
+        Path.cwd() / "instructions" / "art-styles.json",
+        Path("/instructions/art-styles.json"),
+    ]
+    for candidate in art_styles_candidates:
+        if candidate.exists():
+            art_styles_path = candidate
+            break
+    else:
+        raise FileNotFoundError(
+            "instructions/art-styles.json not found. Checked: "
+            + ", ".join(str(p) for p in art_styles_candidates)
+        )
+    with open(art_styles_path) as f:
+        return json.load(f)["art_movements"]
+
+
+def merge_settings(settings, overrides):
+    """Return settings with overrides applied key by key into nested sections."""
+    merged = dict(settings)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_settings(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
 
 
 def record_completed_animal(script_name: str) -> None:
@@ -70,6 +121,11 @@ def record_completed_animal(script_name: str) -> None:
         .strip()
     )
 
+    with _animal_csv_lock:
+        _append_animal(animal_name)
+
+
+def _append_animal(animal_name: str) -> None:
     existing = set()
     if ANIMAL_CSV_PATH.exists():
         with ANIMAL_CSV_PATH.open("r", newline="") as csv_file:
@@ -91,10 +147,24 @@ def record_completed_animal(script_name: str) -> None:
         writer.writerow([animal_name])
 
 
-def generate_narration_with_ollama(source_material):
-    # Load your local model using Ollama
-    model = 'mistral'  # or whatever model you want to use
-    
+def create_short_dir():
+    """Create a fresh output directory and return (short_id, basedir).
+
+    The id starts with the epoch second so runs still sort by start time; the
+    random suffix and exclusive mkdir keep shorts started in the same second
+    (or by another process) from sharing a directory.
+    """
+    while True:
+        short_id = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+        basedir = os.path.join(OUTPUT_ROOT, short_id)
+        try:
+            os.makedirs(basedir)
+            return short_id, basedir
+        except FileExistsError:
+            continue
+
+
+def build_narration_prompt(source_material):
     # Read the prompt from the file (path relative to source tree)
     prompt_candidates = [
         BASE_DIR / 'instructions' / 'prompt.txt',
@@ -115,8 +185,13 @@ def generate_narration_with_ollama(source_material):
         prompt_template = file.read()
     
     # Construct the full prompt
-    prompt = prompt_template + f"\n\nCreate a YouTube short narration based on the following source material:\n\n{source_material}"
-    
+    return prompt_template + f"\n\nCreate a YouTube short narration based on the following source material:\n\n{source_material}"
+
+def generate_narration_with_ollama(source_material):
+    # Load your local model using Ollama
+    model = NARRATION_MODEL
+    prompt = build_narration_prompt(source_material)
+
     # Generate the narration using the model
     # Prefer configured client; fall back to module-level generate
     if ollama_client is not None:
@@ -125,6 +200,14 @@ def generate_narration_with_ollama(source_material):
         response = ollama.generate(model=model, prompt=prompt)
     return response['response']  # Ollama returns a dict with 'response' key
 
+def stream_narration_with_ollama(source_material):
+    """Yield the completion text piece by piece as Ollama generates it."""
+    model = NARRATION_MODEL
+    prompt = build_narration_prompt(source_material)
+    client = ollama_client if ollama_client is not None else ollama
+    for part in client.generate(model=model, prompt=prompt, stream=True):
+        yield part['response']
+
 def get_random_art_style(script_art_styles, art_styles):
     """Get a random art style from the settings and retrieve its full data"""
     if not script_art_styles:
@@ -144,7 +227,120 @@ def get_random_art_style(script_art_styles, art_styles):
     print(f"Warning: Art style '{selected_style_name}' not found in art-styles.json")
     return None
 
+def run_short(source_material, basedir, output_file, settings):
+    """Generate the script for source_material and turn it into a rendered (and optionally uploaded) short.
+
+    TTS and image generation only need parsed scenes, and transcription only
+    needs the narration clips, so they run as parallel branches of a stage
+    graph: script -> {tts -> transcription, images} -> render -> upload.
+    With settings["script"]["stream"], the script stage parses Ollama's
+    output line by line and hands each finished scene to TTS and txt2img
+    while the rest of the script is still being generated.
+    """
+    pipeline = lazy_import("pipeline")
+    narration = lazy_import("narration")
+    narration_dir = os.path.join(basedir, "narrations")
+    parsed = {}
+
+    def script():
+        narration_jobs = narration.NarrationJobs(narration_dir, settings)
+        image_jobs = lazy_import("images").ImageJobs(os.path.join(basedir, "images"), settings)
+        parsed.update(narration_jobs=narration_jobs, image_jobs=image_jobs)
+
+        if settings["script"].get("stream", False):
+            chunks = stream_narration_with_ollama(source_material)
+        else:
+            chunks = [generate_narration_with_ollama(source_material)]
+
+        response_parts = []
+
+        def record(chunks):
+            for chunk in chunks:
+                chunk = narration.clean_response(chunk)
+                response_parts.append(chunk)
+                yield chunk
+
+        data = {"scenes": []}
+        narrations = []
+        art_styles = load_art_styles()
+        try:
+            for line in narration.iter_lines(record(chunks)):
+                item = narration.parse_line(line, data, narrations)
+                if item is None:
+                    continue
+                art_style = get_random_art_style(settings["script"]["art"], art_styles)
+                item["art_style"] = art_style
+                # Start work on each scene as soon as its line is complete
+                if "image" in item:
+                    image_jobs.submit(item)
+                if "narration" in item:
+                    narration_jobs.submit(item["narration"])
+        except Exception:
+            narration_jobs.cancel()
+            image_jobs.cancel()
+            raise
+
+        with open(os.path.join(basedir, "response.txt"), "w") as f:
+            f.write("".join(response_parts))
+        with open(os.path.join(basedir, "data.json"), "w") as f:
+            json.dump(data, f, ensure_ascii=False)
+        parsed.update(data=data, narrations=narrations)
+        print(f"Script complete: {len(narrations)} narration lines, {len(image_jobs.futures)} images.")
+
+    def tts():
+        parsed["narration_jobs"].finish()
+
+    def images():
+        parsed["image_jobs"].finish()
+
+    def transcribe():
+        # Fills the transcript cache that caption rendering reads from
+        print("Transcribing narration...")
+        audio_files = [
+            os.path.join(narration_dir, f"narration_{i+1}.mp3") for i, _ in enumerate(parsed["narrations"])
+        ]
+        lazy_import("transcription").transcribe_batch(audio_files, parsed["narrations"], settings)
+
+    def render():
+        print("Generating video...")
+        lazy_import("video").create(parsed["narrations"], basedir, output_file, settings)
+
+    def upload():
+        print("Uploading video to YouTube...")
+        try:
+            video_id = lazy_import("upload").upload_video(basedir, settings)
+            print(f"Video uploaded successfully! ID: {video_id}")
+        except Exception as e:
+            print(f"Error uploading video: {str(e)}")
+
+    stages = [
+        pipeline.Stage("script", script),
+        pipeline.Stage("tts", tts, after=["script"]),
+        pipeline.Stage("images", images, after=["script"]),
+        pipeline.Stage("transcription", transcribe, after=["tts"], resource="cpu"),
+        pipeline.Stage("render", render, after=["images", "transcription"], resource="cpu"),
+    ]
+    if settings.get("upload", {}).get("enabled", False):
+        stages.append(pipeline.Stage("upload", upload, after=["render"], resource="network"))
+    pipeline.run_stages(stages)
+
+
 def main():
+    global REPORT_IMPORT_TIMES, DRAFT
+    if "--import-times" in sys.argv:
+        sys.argv.remove("--import-times")
+        REPORT_IMPORT_TIMES = True
+    if "--draft" in sys.argv:
+        sys.argv.remove("--draft")
+        DRAFT = True
+    try:
+        run()
+    finally:
+        if REPORT_IMPORT_TIMES:
+            print_import_times()
+
+
+def run():
     initialize_environment()
 
     # Expand the script list with a fresh animal before any other work
@@ -166,6 +362,9 @@ def main():
 
     with open(settings_file) as f:
         settings = json.load(f)
+    if DRAFT:
+        settings = merge_settings(settings, settings.get("draft", {}))
+        print("Draft mode: using preview image, video and encoder settings; upload is disabled.")
 
     if single_script is not None:
         script_names = [single_script]
@@ -178,73 +377,61 @@ def main():
     if not os.path.exists(scripts_dir):
         os.makedirs(scripts_dir)
 
-    for script_name in script_names:
-        if not script_name.endswith(".txt"):
-            script_name += ".txt"
-        script_path = os.path.join(scripts_dir, script_name)
-
-        if not os.path.exists(script_path):
-            print(f"Error: Script file not found: {script_path}")
-            continue
-
-        with open(script_path) as f:
-            source_material = f.read()
-
-        caption_settings = settings.get("captions", {})
-
-        short_id = str(int(time.time()))
-        basedir = os.path.join(OUTPUT_ROOT, short_id)
-        if not os.path.exists(basedir):
-            os.makedirs(basedir)
-
-        print(f"Generating script for {script_name}...")
-
-        response_text = generate_narration_with_ollama(source_material)
-        response_text = (
-            response_text.replace("`", "'")
-            .replace("…", "...")
-            .replace("“", '"')
-            .replace("”", '"')
-        )
+    batch_settings = settings.get("batch", {})
+    workers = max(1, min(int(batch_settings.get("scripts", 1)), len(script_names) or 1))
+    if workers > 1:
+        # Caps are shared between shorts; a single short is limited by its own concurrency settings only
+        lazy_import("pipeline").configure_resources(batch_settings.get("resources", {}))
+        print(f"Batch mode: processing up to {workers} scripts at once.")
 
-        with open(os.path.join(basedir, "response.txt"), "w") as f:
-            f.write(response_text)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="short") as pool:
+        results = list(pool.map(lambda name: process_script(name, scripts_dir, settings), script_names))
 
-        data, narrations = narration.parse(response_text)
+    failed = [name for name, ok in zip(script_names, results) if not ok]
+    print("All scripts processed.")
+    if failed:
+        print(f"Failed scripts: {', '.join(failed)}")
+        sys.exit(1)
 
-        for item in data["scenes"]:
-            art_style = get_random_art_style(settings["script"]["art"], art_styles)
-            item["art_style"] = art_style
 
-        with open(os.path.join(basedir, "data.json"), "w") as f:
-            json.dump(data, f, ensure_ascii=False)
+def process_script(script_name, scripts_dir, settings):
+    """Render one script into its own output directory; returns False if it failed or was missing."""
+    if not script_name.endswith(".txt"):
+        script_name += ".txt"
+    script_path = os.path.join(scripts_dir, script_name)
 
-        print("Generating narration...")
-        narration.create(data, os.path.join(basedir, "narrations"))
+    if not os.path.exists(script_path):
+        print(f"Error: Script file not found: {script_path}")
+        return False
 
-        print("Generating images...")
-        images.create_from_data(data, os.path.join(basedir, "images"), settings)
+    with open(script_path) as f:
+        source_material = f.read()
 
-        print("Generating video...")
-        output_file = f"{script_name}.mp4"
-        video.create(narrations, basedir, output_file, settings)
+    short_id, basedir = create_short_dir()
 
-        print(f"DONE! Here's your video: {os.path.join(basedir, output_file)}")
+    print(f"Generating script for {script_name} (short {short_id})...")
 
+    output_file = f"{script_name}.mp4"
+    try:
+        run_short(source_material, basedir, output_file, settings)
+    except Exception as e:
+        # One bad script should not take the rest of the batch down with it, but keep the
+        # stack trace a crashing serial run used to leave in the log
+        print(f"Error processing {script_name}: {e}")
+        print(traceback.format_exc())
+        return False
+
+    print(f"DONE! Here's your video: {os.path.join(basedir, output_file)}")
+
+    if not DRAFT:
+        # Drafts are previews, so the animal stays available for a real run
         record_completed_animal(script_name)
 
-        if settings.get("upload", {}).get("enabled", False):
-            print("Uploading video to YouTube...")
-            try:
-                video_id = upload.upload_video(basedir, settings)
-                print(f"Video uploaded successfully! ID: {video_id}")
-            except Exception as e:
-                print(f"Error uploading video: {str(e)}")
+    print("Process complete!")
+    return True
 
-        print("Process complete!")
-
-    print("All scripts processed.")
 
+import_times["<startup>"] = time.perf_counter() - _module_started
 
 if __name__ == "__main__":
     main()
@@ -1,13 +1,67 @@
-# from elevenlabs import voices, generate, play, stream, save
+import subprocess
+import threading
 import time
-from gtts import gTTS
+from concurrent.futures import ThreadPoolExecutor
 import os
 import re
 import json
+import audioprobe
+import cache
+import pipeline
+import tts
 
-# You can set this environment variable to choose the service
-# export TTS_SERVICE=gtts  # or elevenlabs
-TTS_SERVICE = os.getenv('TTS_SERVICE', 'gtts')  # Default to gtts if not set
+# Size budget of the shared TTS cache; 0 disables it
+try:
+    TTS_CACHE_MAX_MB = float(os.getenv("TTS_CACHE_MAX_MB", "512"))
+except ValueError:
+    TTS_CACHE_MAX_MB = 512.0
+
+def tts_cache_entry(text, backend, split=None):
+    """Cache paths (mp3, json) for text voiced by backend, or None when caching is off.
+
+    Clips cut from a whole-script voicing carry part of the surrounding
+    pauses, so split (from split_key) keys them by pause length and by which
+    sides of the clip have a pause, apart from single-line voicings.
+    """
+    if TTS_CACHE_MAX_MB <= 0:
+        return None
+    normalized = " ".join(text.split())
+    voice = dict(backend.voice(), split=split) if split else backend.voice()
+    key = cache.content_key(voice, normalized)
+    tts_dir = cache.cache_dir("tts")
+    return os.path.join(tts_dir, f"{key}.mp3"), os.path.join(tts_dir, f"{key}.json")
+
+def load_cached_narration(text, output_file, backend, split=None):
+    """Copy a cached voicing of text to output_file; returns its duration in ms, or None on a miss."""
+    entry = tts_cache_entry(text, backend, split)
+    if entry is None:
+        return None
+    audio_path, info_path = entry
+    info = cache.read_json(info_path)
+    if info is None or not cache.fetch_file(audio_path, output_file):
+        return None
+    try:
+        os.utime(info_path)
+    except OSError:
+        pass
+    return info["duration"]
+
+def store_cached_narration(text, output_file, duration, backend, split=None):
+    entry = tts_cache_entry(text, backend, split)
+    if entry is None:
+        return
+    audio_path, info_path = entry
+    cache.store_file(output_file, audio_path)
+    cache.write_json(info_path, {"duration": duration, "text": text})
+
+def clean_response(text):
+    """Normalize typographic characters in LLM output; safe to apply to any piece of the text."""
+    return (
+        text.replace("`", "'")
+        .replace("…", "...")
+        .replace("“", '"')
+        .replace("”", '"')
+    )
 
 def parse(text):
     """Parse the input text into data and narrations."""
@@ -20,140 +74,345 @@ def parse(text):
     
     # Process each line
     for line in lines:
-        # Skip ### markers
-        if line == '###':
-            continue
-            
-        # Check if this is an image description
-        if line.startswith('[') and line.endswith(']'):
-            # Extract the image description and add to scenes
-            image_desc = line[1:-1]  # Remove the brackets
-            data["scenes"].append({"image": image_desc})
-            
-        # Check if this is narration
-        elif line.startswith('Narrator:'):
-            # Extract the narration text
-            narration = line.replace('Narrator:', '').strip()
-            # Remove quotes if present
-            narration = narration.strip('"').strip('"').strip('"')
-            # Add to both scenes and narrations
-            data["scenes"].append({"narration": narration})
-            narrations.append(narration)
-
-        elif line.startswith('Title:'):
-            # Extract the title text
-            title = line.replace('Title:', '').strip()
-            # Remove quotes if present
-            title = title.strip('"').strip('"').strip('"')
-            # Add to data
-            data["title"] = title
-
-        elif line.startswith('Description:'):
-            # Extract the description text
-            description = line.replace('Description:', '').strip()
-            # Remove quotes if present
-            description = description.strip('"').strip('"').strip('"')
-            # Add to data
-            data["description"] = description
-
-        elif line.startswith('Tags:'):
-            # Extract the tags text
-            tags = line.replace('Tags:', '').strip()
-            tags_array = json.loads(tags)
-            # Add to data
-            data["tags"] = tags_array
+        parse_line(line, data, narrations)
     
     return data, narrations
 
-def create(data, output_dir):
+def parse_line(line, data, narrations):
+    """Apply one stripped script line to data/narrations; returns the scene it added, if any."""
+    # Skip ### markers
+    if line == '###':
+        return None
+
+    # Check if this is an image description
+    if line.startswith('[') and line.endswith(']'):
+        # Extract the image description and add to scenes
+        image_desc = line[1:-1]  # Remove the brackets
+        data["scenes"].append({"image": image_desc})
+        return data["scenes"][-1]
+
+    # Check if this is narration
+    elif line.startswith('Narrator:'):
+        # Extract the narration text
+        narration = line.replace('Narrator:', '').strip()
+        # Remove quotes if present
+        narration = narration.strip('"').strip('"').strip('"')
+        # Add to both scenes and narrations
+        data["scenes"].append({"narration": narration})
+        narrations.append(narration)
+        return data["scenes"][-1]
+
+    elif line.startswith('Title:'):
+        # Extract the title text
+        title = line.replace('Title:', '').strip()
+        # Remove quotes if present
+        title = title.strip('"').strip('"').strip('"')
+        # Add to data
+        data["title"] = title
+
+    elif line.startswith('Description:'):
+        # Extract the description text
+        description = line.replace('Description:', '').strip()
+        # Remove quotes if present
+        description = description.strip('"').strip('"').strip('"')
+        # Add to data
+        data["description"] = description
+
+    elif line.startswith('Tags:'):
+        # Extract the tags text
+        tags = line.replace('Tags:', '').strip()
+        tags_array = json.loads(tags)
+        # Add to data
+        data["tags"] = tags_array
+    return None
+
+def iter_lines(chunks):
+    """Yield complete, stripped, non-empty lines from a stream of text chunks as soon as each one ends."""
+    pending = ""
+    for chunk in chunks:
+        pending += chunk
+        *complete, pending = pending.split('\n')
+        for line in complete:
+            if line.strip():
+                yield line.strip()
+    if pending.strip():
+        yield pending.strip()
+
+class TokenBucket:
+    """Thread-safe token bucket: at most `rate` acquisitions per second on average, bursting to `burst`."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def create(data, output_dir, settings=None):
     """Create audio files from the narration data."""
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    
-    narration_count = 0
-    narration_data = []
-    
-    for i, item in enumerate(data["scenes"]):
-        if "narration" not in item:
-            continue
-            
-        narration_count += 1
-        output_file = os.path.join(output_dir, f"narration_{narration_count}.mp3")
-        
+    jobs = NarrationJobs(output_dir, settings)
+    for item in data["scenes"]:
+        if "narration" in item:
+            jobs.submit(item["narration"])
+    jobs.finish()
+
+class NarrationJobs:
+    """Voice narration lines as they become known, numbering them in submission order.
+
+    Lines are synthesized by the settings["narration"]["backend"] engine
+    concurrently, capped by ["concurrency"] and, for remote services, a token
+    bucket of ["rate"] requests per second, but files and narration.json keep
+    the script's line order. With ["mode"] set to "script", lines are
+    collected instead and voiced in one request by finish().
+    """
+
+    def __init__(self, output_dir, settings=None):
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        self.output_dir = output_dir
+
+        narration_settings = (settings or {}).get("narration", {})
+        concurrency = max(1, int(narration_settings.get("concurrency", 1)))
+        self.backend = tts.get_backend(settings)
+        # Local engines have no quota to respect
+        rate = narration_settings.get("rate", 0) if self.backend.remote else 0
+        self.limiter = TokenBucket(rate, narration_settings.get("burst", concurrency))
+        self.whole_script = narration_settings.get("mode", "lines") == "script"
+        if self.whole_script and not self.backend.pause_markup:
+            # Without break markup, pauses inside a line look the same as pauses between lines
+            print(f"TTS backend '{self.backend.name}' has no pause markup; voicing narration line by line.")
+            self.whole_script = False
+        self.pause = float(narration_settings.get("pause", 0.8))
+        self.pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="tts")
+        self.texts = []
+        self.futures = []
+
+    def submit(self, text):
+        """Queue one narration line and return its narration number."""
+        self.texts.append(text)
+        narration_count = len(self.texts)
+        if not self.whole_script:
+            self._submit_line(narration_count, text)
+        return narration_count
+
+    def _submit_line(self, narration_count, text):
+        self.futures.append(self.pool.submit(create_narration, narration_count, text, self.output_dir, self.limiter, self.backend))
+
+    def cancel(self):
+        """Drop queued lines; lines already being voiced are left to finish."""
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def finish(self):
+        """Wait for every line and write narration.json next to the narrations directory."""
+        try:
+            narration_data = None
+            if self.whole_script and self.texts:
+                narration_data = create_script_narration(self.texts, self.output_dir, self.pause, self.limiter, self.backend)
+                if narration_data is None:
+                    for narration_count, text in enumerate(self.texts, start=1):
+                        self._submit_line(narration_count, text)
+            if narration_data is None:
+                # Collect in submission order so narration.json matches the script
+                narration_data = [future.result() for future in self.futures]
+        finally:
+            self.pool.shutdown(wait=True)
+
+        parent_dir = os.path.dirname(self.output_dir)
+        with open(os.path.join(parent_dir, "narration.json"), "w") as f:
+            json.dump(narration_data, f, indent=2)
+
+        if TTS_CACHE_MAX_MB > 0:
+            removed = cache.evict(cache.cache_dir("tts"), int(TTS_CACHE_MAX_MB * 1024 * 1024))
+            if removed:
+                print(f"Evicted {removed} least recently used narrations from the TTS cache.")
+
+def create_narration(narration_count, text, output_dir, limiter=None, backend=None):
+    """Voice one narration line as narration_<narration_count>.mp3 and return its narration.json entry."""
+    backend = backend or tts.get_backend()
+    output_file = os.path.join(output_dir, f"narration_{narration_count}.mp3")
+
+    duration = load_cached_narration(text, output_file, backend)
+    if duration is not None:
+        print(f"Narration {narration_count} reused from the TTS cache")
+        return {
+            "filename": f"narration_{narration_count}.mp3",
+            "duration": duration,
+            "text": text
+        }
+
+    max_retries = 3
+    for attempt in range(max_retries):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            print(f"Creating narration {narration_count} with {backend.name}... (attempt {attempt + 1})")
+            with pipeline.resource("network" if backend.remote else None):
+                backend.synthesize(text, output_file)
+            print(f"Successfully created narration {narration_count}")
+
+            # Read the duration from the MP3 frame headers; narration.json is what video.create times frames from
+            duration = audioprobe.mp3_duration_ms(output_file)
+            store_cached_narration(text, output_file, duration, backend)
+
+            return {
+                "filename": f"narration_{narration_count}.mp3",
+                "duration": duration,
+                "text": text
+            }
+
+        except Exception as e:
+            if attempt == max_retries - 1:  # Last attempt
+                print(f"Error creating narration {narration_count}: {str(e)}")
+                raise
+            print(f"Narration {narration_count} attempt {attempt + 1} failed, retrying...")
+            time.sleep(2 ** attempt)  # Exponential backoff
+
+
+def detect_silences(path, min_silence, noise_db=-35):
+    """(start, end) seconds of every silence of at least min_silence seconds in an audio file."""
+    result = subprocess.run(
+        ['ffmpeg', '-hide_banner', '-nostats', '-i', path,
+         '-af', f'silencedetect=noise={noise_db}dB:d={min_silence}', '-f', 'null', '-'],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"FFmpeg silence detection failed for {path}: {result.stderr.strip()[-500:]}")
+    silences = []
+    start = None
+    for match in re.finditer(r"silence_(start|end): (-?[\d.]+)", result.stderr):
+        if match.group(1) == "start":
+            start = max(0.0, float(match.group(2)))
+        elif start is not None:
+            silences.append((start, float(match.group(2))))
+            start = None
+    return silences
+
+def split_points(silences, total, count):
+    """Cut times (seconds) splitting total seconds of audio into count clips at the longest inner silences.
+
+    Cuts fall in the middle of each chosen silence, so every clip keeps half
+    of the pause on either side and the clips add up to the whole file.
+    Returns None when there are fewer pauses than line breaks.
+    """
+    inner = [(start, end) for start, end in silences if start > 0.05 and end < total - 0.05]
+    if len(inner) < count - 1:
+        return None
+    longest = sorted(inner, key=lambda silence: silence[1] - silence[0], reverse=True)[:count - 1]
+    return sorted((start + end) / 2 for start, end in longest)
+
+def split_key(pause, index, count):
+    """Cache context for clip index of count cut from a script voiced with pause seconds between lines."""
+    return {"pause": pause, "leading_pause": index > 0, "trailing_pause": index < count - 1}
+
+def clips_match_lines(bounds, texts, pause):
+    """True if every clip's speech time is roughly its line's share of the characters.
+
+    Guards against cuts at a pause inside a line, which would pair clips with
+    the wrong text in narration.json.
+    """
+    lengths = [max(len(text), 10) for text in texts]
+    speech_total = bounds[-1] - bounds[0] - pause * (len(texts) - 1)
+    if speech_total <= 0:
+        return False
+    for index, (start, end) in enumerate(zip(bounds, bounds[1:])):
+        # Each clip carries half of the pause on every side that has one
+        pauses = 0.5 * pause * ((index > 0) + (index < len(texts) - 1))
+        expected = speech_total * lengths[index] / sum(lengths)
+        if not 0.5 <= (end - start - pauses) / expected <= 2.0:
+            return False
+    return True
+
+def create_script_narration(texts, output_dir, pause, limiter=None, backend=None):
+    """Voice every line in one TTS request and split the result into narration_<n>.mp3 clips.
+
+    Returns the narration.json entries, or None if the voicing could not be
+    split into one clip per line (the caller then voices lines one by one).
+    """
+    backend = backend or tts.get_backend()
+    clips = [os.path.join(output_dir, f"narration_{n}.mp3") for n in range(1, len(texts) + 1)]
+
+    splits = [split_key(pause, index, len(texts)) for index in range(len(texts))]
+    durations = [load_cached_narration(text, clip, backend, split) for text, clip, split in zip(texts, clips, splits)]
+    if None not in durations:
+        print(f"All {len(texts)} narrations reused from the TTS cache")
+    else:
+        script_file = os.path.join(output_dir, "narration_script.mp3")
         max_retries = 3
         for attempt in range(max_retries):
+            if limiter is not None:
+                limiter.acquire()
             try:
-                if TTS_SERVICE.lower() == 'gtts':
-                    print(f"Creating narration {narration_count} with gTTS... (attempt {attempt + 1})")
-                    tts = gTTS(
-                        text=item["narration"],
-                        lang='en',
-                        tld='com',
-                        slow=False
-                    )
-                    tts.save(output_file)
-                    print(f"Successfully created narration {narration_count}")
-                    
-                    # Get audio duration using AudioSegment
-                    from pydub import AudioSegment
-                    audio = AudioSegment.from_mp3(output_file)
-                    duration = len(audio)
-                    
-                    # Add to narration data
-                    narration_data.append({
-                        "filename": f"narration_{narration_count}.mp3",
-                        "duration": duration,
-                        "text":item["narration"]
-                    })
-                    
-                    break
-                else:
-                    # Use ElevenLabs...
-                    audio = generate(
-                        text=item["narration"],
-                        voice="Adam"
-                    )
-                    with open(output_file, 'wb') as f:
-                        f.write(audio)
-                    
-                    # Get audio duration using AudioSegment
-                    audio = AudioSegment.from_mp3(output_file)
-                    duration = len(audio)
-                    
-                    # Add to narration data
-                    narration_data.append({
-                        "filename": f"narration_{narration_count}.mp3",
-                        "duration": duration,
-                        "text":item["narration"]
-                    })
-                    
+                print(f"Creating {len(texts)} narrations in one request with {backend.name}... (attempt {attempt + 1})")
+                with pipeline.resource("network" if backend.remote else None):
+                    backend.synthesize_script(texts, script_file, pause)
+                break
             except Exception as e:
-                if attempt == max_retries - 1:  # Last attempt
-                    print(f"Error creating narration {narration_count}: {str(e)}")
+                if attempt == max_retries - 1:
+                    print(f"Error creating the script narration: {str(e)}")
                     raise
-                print(f"Attempt {attempt + 1} failed, retrying...")
-                time.sleep(2 ** attempt)  # Exponential backoff
-        
-    parent_dir = os.path.dirname(output_dir)
-    with open(os.path.join(parent_dir, "narration.json"), "w") as f:
-        json.dump(narration_data, f, indent=2)
+                print(f"Script narration attempt {attempt + 1} failed, retrying...")
+                time.sleep(2 ** attempt)
+
+        total = audioprobe.mp3_duration_ms(script_file) / 1000
+        cuts = split_points(detect_silences(script_file, max(0.2, pause / 3)), total, len(texts))
+        if cuts is None:
+            print(f"Could not find {len(texts) - 1} pauses in the script narration; voicing lines separately.")
+            os.remove(script_file)
+            return None
+        bounds = [0.0] + cuts + [total]
+        if not clips_match_lines(bounds, texts, pause):
+            print("Script narration pauses do not line up with the narration lines; voicing lines separately.")
+            os.remove(script_file)
+            return None
+
+        # One decode of the script feeds every clip
+        command = ['ffmpeg', '-y', '-loglevel', 'error', '-i', script_file]
+        for index, (clip, start, end) in enumerate(zip(clips, bounds, bounds[1:])):
+            command += ['-ss', f"{start:.3f}"]
+            if index < len(clips) - 1:
+                command += ['-to', f"{end:.3f}"]
+            command += ['-c:a', 'libmp3lame', '-q:a', '4', clip]
+        result = subprocess.run(command, capture_output=True, text=True)
+        os.remove(script_file)
+        if result.returncode != 0:
+            raise RuntimeError(f"FFmpeg failed to split the script narration: {result.stderr.strip()}")
+
+        durations = []
+        for text, clip, split in zip(texts, clips, splits):
+            # Measured from the written clip, so narration.json matches the audio exactly
+            duration = audioprobe.mp3_duration_ms(clip)
+            store_cached_narration(text, clip, duration, backend, split)
+            durations.append(duration)
+        print(f"Split the script narration into {len(clips)} clips")
 
+    return [
+        {"filename": os.path.basename(clip), "duration": duration, "text": text}
+        for clip, duration, text in zip(clips, durations, texts)
+    ]
 
-def generate_narration(text, output_file):
+def generate_narration(text, output_file, settings=None):
     """Generate a single narration file."""
     try:
-        if TTS_SERVICE.lower() == 'gtts':
-            # Use Google TTS
-            tts = gTTS(text=text, lang='en', tld='com')
-            tts.save(output_file)
-        else:
-            # Use ElevenLabs
-            audio = generate(
-                text=text,
-                voice="Adam"
-            )
-            with open(output_file, 'wb') as f:
-                f.write(audio)
+        backend = tts.get_backend(settings)
+        if load_cached_narration(text, output_file, backend) is not None:
+            return True
+        backend.synthesize(text, output_file)
+        store_cached_narration(text, output_file, audioprobe.mp3_duration_ms(output_file), backend)
         return True
     except Exception as e:
         print(f"Error generating narration: {str(e)}")
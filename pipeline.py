@@ -0,0 +1,106 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+# Process-wide caps per resource class ("gpu", "cpu", "network"), shared by every short in a batch
+_resources = {}
+_resources_lock = threading.Lock()
+
+
+def configure_resources(limits):
+    """Cap how many holders each resource class may have at once; 0 or a missing class means no cap."""
+    with _resources_lock:
+        _resources.clear()
+        for name, limit in (limits or {}).items():
+            if int(limit) > 0:
+                _resources[name] = threading.BoundedSemaphore(int(limit))
+
+
+@contextmanager
+def resource(name):
+    """Hold one slot of resource class name for the duration of the block (no-op when uncapped)."""
+    semaphore = _resources.get(name)
+    if semaphore is None:
+        yield
+        return
+    with semaphore:
+        yield
+
+
+class Stage:
+    """One step of a short: a callable, the stages it must wait for and the resource class it occupies."""
+
+    def __init__(self, name, run, after=(), resource=None):
+        self.name = name
+        self.run = run
+        self.after = tuple(after)
+        self.resource = resource
+
+    def __call__(self):
+        with resource(self.resource):
+            return self.run()
+
+
+def run_stages(stages, max_workers=None):
+    """Run stages concurrently as soon as everything they depend on has finished.
+
+    Stages are threads: the heavy lifting (TTS and image HTTP calls, Whisper,
+    ffmpeg) releases the GIL, so independent branches overlap and a short
+    takes about as long as its longest branch. A stage with a resource class
+    first waits for a slot of it (see configure_resources), which is how
+    shorts running side by side in a batch share the GPU, CPU and network.
+    If a stage fails, stages that depend on it are skipped, stages already
+    running are allowed to finish, and the first error is raised.
+    Returns {stage name: return value}.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        missing = [name for name in stage.after if name not in by_name]
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown stage(s): {', '.join(missing)}")
+
+    results = {}
+    failed = {}
+    pending = list(stages)
+    running = {}
+    started_at = {}
+    run_started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(stages), thread_name_prefix="stage") as pool:
+        while pending or running:
+            for stage in list(pending):
+                if any(name in failed for name in stage.after):
+                    pending.remove(stage)
+                    failed[stage.name] = None
+                    print(f"Skipping stage '{stage.name}' because a stage it depends on failed.")
+                elif all(name in results for name in stage.after):
+                    pending.remove(stage)
+                    started_at[stage.name] = time.perf_counter()
+                    running[pool.submit(stage)] = stage
+
+            if not running:
+                if not pending:
+                    # Everything left was skipped after a failure
+                    break
+                # Nothing can start: a dependency cycle
+                names = ", ".join(stage.name for stage in pending)
+                raise RuntimeError(f"Stages can never run (dependency cycle): {names}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                elapsed = time.perf_counter() - started_at[stage.name]
+                try:
+                    results[stage.name] = future.result()
+                    print(f"Stage '{stage.name}' finished in {elapsed:.1f}s.")
+                except Exception as e:
+                    failed[stage.name] = e
+                    print(f"Stage '{stage.name}' failed after {elapsed:.1f}s: {e}")
+
+    print(f"Stages finished in {time.perf_counter() - run_started:.1f}s.")
+    for stage in stages:
+        error = failed.get(stage.name)
+        if error is not None:
+            raise error
+    return results
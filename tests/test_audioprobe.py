@@ -0,0 +1,61 @@
+import struct
+
+import audioprobe
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, mono, no padding: 417-byte frames of 1152 samples
+HEADER = bytes([0xFF, 0xFB, 0x90, 0xC0])
+FRAME_LENGTH = 417
+FRAME_MS = 1152 * 1000 / 44100
+
+
+def audio_frame():
+    return HEADER + bytes(FRAME_LENGTH - 4)
+
+
+def info_frame(frames, delay=None, padding=None):
+    """A first frame carrying an Info tag (frames field only), optionally with a LAME extension."""
+    # Mono MPEG-1 side info is 17 bytes, so the tag starts right after it
+    body = bytes(17) + b"Info" + struct.pack(">II", 0x01, frames)
+    if delay is not None:
+        lame = bytearray(b"LAME3.100" + bytes(15))
+        lame[21:24] = bytes([delay >> 4, ((delay & 0x0F) << 4) | (padding >> 8), padding & 0xFF])
+        body += bytes(lame)
+    return HEADER + body + bytes(FRAME_LENGTH - 4 - len(body))
+
+
+def write(tmp_path, data, name="test.mp3"):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_plain_frames_are_counted(tmp_path):
+    path = write(tmp_path, audio_frame() * 100)
+    assert audioprobe.mp3_duration_ms(path) == round(100 * FRAME_MS)
+
+
+def test_id3v2_tag_is_skipped(tmp_path):
+    tag = b"ID3\x04\x00\x00" + bytes([0, 0, 0, 20]) + bytes(20)
+    path = write(tmp_path, tag + audio_frame() * 50)
+    assert audioprobe.mp3_duration_ms(path) == round(50 * FRAME_MS)
+
+
+def test_info_frame_is_not_audio(tmp_path):
+    path = write(tmp_path, info_frame(100) + audio_frame() * 100)
+    assert audioprobe.mp3_duration_ms(path) == round(100 * FRAME_MS)
+
+
+def test_lame_delay_and_padding_are_removed(tmp_path):
+    path = write(tmp_path, info_frame(100, delay=576, padding=1000) + audio_frame() * 100)
+    assert audioprobe.mp3_duration_ms(path) == round((100 * 1152 - 1576) * 1000 / 44100)
+
+
+def test_concatenated_streams_are_added(tmp_path):
+    stream = info_frame(100) + audio_frame() * 100
+    path = write(tmp_path, stream + stream)
+    assert audioprobe.mp3_duration_ms(path) == round(200 * FRAME_MS)
+
+
+def test_info_count_that_disagrees_with_the_frames_is_ignored(tmp_path):
+    path = write(tmp_path, info_frame(40) + audio_frame() * 100)
+    assert audioprobe.mp3_duration_ms(path) == round(100 * FRAME_MS)
@@ -0,0 +1,44 @@
+import pytest
+
+import pipeline
+
+
+def test_failed_stage_skips_dependants_and_reraises():
+    ran = []
+
+    def script():
+        raise ValueError("ollama failed")
+
+    stages = [
+        pipeline.Stage("script", script),
+        pipeline.Stage("tts", lambda: ran.append("tts"), after=["script"]),
+        pipeline.Stage("render", lambda: ran.append("render"), after=["tts"]),
+    ]
+    with pytest.raises(ValueError, match="ollama failed"):
+        pipeline.run_stages(stages)
+    assert ran == []
+
+
+def test_independent_branch_still_runs_after_failure():
+    ran = []
+
+    def images():
+        raise RuntimeError("no image")
+
+    stages = [
+        pipeline.Stage("images", images),
+        pipeline.Stage("tts", lambda: ran.append("tts")),
+        pipeline.Stage("render", lambda: ran.append("render"), after=["images", "tts"]),
+    ]
+    with pytest.raises(RuntimeError, match="no image"):
+        pipeline.run_stages(stages)
+    assert ran == ["tts"]
+
+
+def test_dependency_cycle_is_reported():
+    stages = [
+        pipeline.Stage("a", lambda: None, after=["b"]),
+        pipeline.Stage("b", lambda: None, after=["a"]),
+    ]
+    with pytest.raises(RuntimeError, match="dependency cycle"):
+        pipeline.run_stages(stages)
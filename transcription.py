@@ -0,0 +1,81 @@
+import os
+import threading
+import cache
+
+DEFAULT_MODEL = "base"
+
+# Whisper models are expensive to load, so keep them for the life of the process
+_models = {}
+_model_lock = threading.Lock()
+
+def load_model(name=DEFAULT_MODEL):
+    """Return a process-wide Whisper model, loading it on first use."""
+    with _model_lock:
+        if name not in _models:
+            import whisper
+            print(f"Loading Whisper model '{name}'...")
+            _models[name] = whisper.load_model(name)
+        return _models[name]
+
+def _simplify(segments):
+    """Keep only the fields caption rendering needs, as plain JSON types."""
+    return [
+        {
+            "start": float(segment["start"]),
+            "end": float(segment["end"]),
+            "text": segment.get("text", ""),
+            "words": [
+                {"word": word["word"], "start": float(word["start"]), "end": float(word["end"])}
+                for word in segment.get("words", [])
+            ],
+        }
+        for segment in segments
+    ]
+
+def transcribe_batch(audio_files, prompts, settings=None):
+    """Transcribe narration clips with word timestamps, one segment list per clip.
+
+    Results are cached on disk by audio content hash, prompt and model, so
+    re-renders of the same narration never run ASR again. Clips that miss the
+    cache are transcribed together with a single warm Whisper model; if
+    Whisper is unavailable, Captacity's OpenAI API transcriber is used.
+    """
+    model_name = (settings or {}).get("transcription", {}).get("model", DEFAULT_MODEL)
+    transcript_dir = cache.cache_dir("transcripts")
+
+    results = [None] * len(audio_files)
+    misses = []
+    for i, (audio_file, prompt) in enumerate(zip(audio_files, prompts)):
+        key = cache.content_key(cache.file_digest(audio_file), prompt or "", model_name)
+        entry_path = os.path.join(transcript_dir, f"{key}.json")
+        cached = cache.read_json(entry_path)
+        if cached is not None:
+            results[i] = cached
+        else:
+            misses.append((i, audio_file, prompt, entry_path))
+
+    if misses:
+        print(f"Transcribing {len(misses)} of {len(audio_files)} narration clips "
+              f"({len(audio_files) - len(misses)} cached)...")
+    for i, audio_file, prompt, entry_path in misses:
+        segments = _simplify(_transcribe(audio_file, prompt, model_name))
+        cache.write_json(entry_path, segments)
+        results[i] = segments
+
+    return results
+
+def _transcribe(audio_file, prompt, model_name):
+    try:
+        model = load_model(model_name)
+    except ImportError:
+        import captacity
+        return captacity.transcriber.transcribe_with_api(audio_file=audio_file, prompt=prompt)
+    # Same options Captacity's transcribe_locally uses
+    with _model_lock:
+        transcription = model.transcribe(
+            audio=audio_file,
+            word_timestamps=True,
+            fp16=False,
+            initial_prompt=prompt,
+        )
+    return transcription["segments"]
@@ -0,0 +1,231 @@
+import json
+import os
+import shutil
+import subprocess
+import threading
+from xml.sax.saxutils import escape
+
+# Backends by name; selected with settings["narration"]["backend"] (or TTS_SERVICE for older setups)
+BACKENDS = {}
+_instances = {}
+_instances_lock = threading.Lock()
+
+# ElevenLabs' stock "Adam" voice
+ELEVENLABS_DEFAULT_VOICE = "pNInz6obpgDQGcFmaJgB"
+
+
+def register(name):
+    """Class decorator adding a TTSBackend subclass to the registry under name."""
+    def decorator(cls):
+        cls.name = name
+        BACKENDS[name] = cls
+        return cls
+    return decorator
+
+
+def get_backend(settings=None):
+    """Return the configured TTS backend from settings["narration"].
+
+    Instances are shared per process so warm engines (piper) stay loaded
+    across lines and shorts.
+    """
+    narration_settings = (settings or {}).get("narration", {})
+    name = (narration_settings.get("backend") or os.getenv("TTS_SERVICE", "gtts")).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown TTS backend '{name}'. Available: {', '.join(sorted(BACKENDS))}")
+    options = narration_settings.get(name, {})
+    key = (name, json.dumps(options, sort_keys=True))
+    with _instances_lock:
+        if key not in _instances:
+            _instances[key] = BACKENDS[name](options)
+        return _instances[key]
+
+
+class TTSBackend:
+    """Turns one narration line into an MP3 file.
+
+    remote backends are rate limited by narration.create; local ones run
+    at whatever concurrency settings["narration"]["concurrency"] allows.
+    """
+
+    name = None
+    remote = True
+    # True if join_lines/synthesize_script mark pauses between lines explicitly;
+    # narration's "script" mode needs it to tell line breaks from sentence breaks
+    pause_markup = False
+
+    def __init__(self, options):
+        self.options = options
+
+    def voice(self):
+        """Everything besides the text that changes the audio; part of the TTS cache key."""
+        return {"service": self.name, **self.options}
+
+    def synthesize(self, text, output_file):
+        raise NotImplementedError
+
+    def synthesize_script(self, lines, output_file, pause):
+        """Voice several lines in one request, with a pause of about pause seconds between them."""
+        self.synthesize(self.join_lines(lines, pause), output_file)
+
+    def join_lines(self, lines, pause):
+        # Paragraph breaks; pauses between sentences inside a line come out just as long
+        return "\n\n".join(end_sentence(line) for line in lines)
+
+
+def end_sentence(line):
+    line = line.strip()
+    return line if line[-1:] in ".!?" else f"{line}."
+
+
+def encode_mp3(wav_bytes, output_file):
+    """Encode WAV audio from a local engine to MP3 like the remote services return."""
+    result = subprocess.run(
+        ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'wav', '-i', 'pipe:0',
+         '-c:a', 'libmp3lame', '-q:a', '4', output_file],
+        input=wav_bytes,
+        capture_output=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"FFmpeg failed to encode {output_file}: {result.stderr.decode(errors='replace').strip()}")
+
+
+@register("gtts")
+class GTTSBackend(TTSBackend):
+    def voice(self):
+        return {
+            "service": "gtts",
+            "lang": self.options.get("lang", "en"),
+            "tld": self.options.get("tld", "com"),
+            "slow": self.options.get("slow", False),
+        }
+
+    def synthesize(self, text, output_file):
+        from gtts import gTTS
+        voice = self.voice()
+        gTTS(text=text, lang=voice["lang"], tld=voice["tld"], slow=voice["slow"]).save(output_file)
+
+
+@register("elevenlabs")
+class ElevenLabsBackend(TTSBackend):
+    pause_markup = True
+
+    def voice(self):
+        return {
+            "service": "elevenlabs",
+            "voice_id": self.options.get("voice_id", ELEVENLABS_DEFAULT_VOICE),
+            "model_id": self.options.get("model_id", "eleven_multilingual_v2"),
+        }
+
+    def join_lines(self, lines, pause):
+        # ElevenLabs reads SSML-style breaks of up to 3 seconds inline
+        return f' <break time="{min(pause, 3.0):.1f}s" /> '.join(end_sentence(line) for line in lines)
+
+    def synthesize(self, text, output_file):
+        import requests
+        api_key = os.getenv("ELEVEN_API_KEY")
+        if not api_key:
+            raise RuntimeError("ELEVEN_API_KEY is not set.")
+        voice = self.voice()
+        response = requests.post(
+            f"https://api.elevenlabs.io/v1/text-to-speech/{voice['voice_id']}",
+            headers={"xi-api-key": api_key, "accept": "audio/mpeg"},
+            json={"text": text, "model_id": voice["model_id"]},
+            timeout=(10, 120),
+            stream=True,
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"ElevenLabs returned {response.status_code}: {response.text[:500]}")
+        with open(output_file, "wb") as f:
+            for chunk in response.iter_content(64 * 1024):
+                f.write(chunk)
+
+
+@register("espeak-ng")
+class EspeakBackend(TTSBackend):
+    """Offline synthesis with espeak-ng; each line is a millisecond-scale local process."""
+
+    remote = False
+    pause_markup = True
+
+    def voice(self):
+        return {
+            "service": "espeak-ng",
+            "voice": self.options.get("voice", "en-us"),
+            "speed": self.options.get("speed", 165),
+            "pitch": self.options.get("pitch", 50),
+        }
+
+    def synthesize(self, text, output_file):
+        self._speak(text, output_file)
+
+    def synthesize_script(self, lines, output_file, pause):
+        breaks = f'<break time="{int(pause * 1000)}ms"/>'
+        ssml = f"<speak>{breaks.join(escape(end_sentence(line)) for line in lines)}</speak>"
+        self._speak(ssml, output_file, ssml=True)
+
+    def _speak(self, text, output_file, ssml=False):
+        binary = shutil.which("espeak-ng") or shutil.which("espeak")
+        if binary is None:
+            raise RuntimeError("espeak-ng not found in PATH.")
+        voice = self.voice()
+        command = [binary, '-v', str(voice["voice"]), '-s', str(voice["speed"]), '-p', str(voice["pitch"]), '--stdout']
+        if ssml:
+            command.append('-m')
+        result = subprocess.run(command + [text], capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"espeak-ng failed: {result.stderr.decode(errors='replace').strip()}")
+        encode_mp3(result.stdout, output_file)
+
+
+@register("piper")
+class PiperBackend(TTSBackend):
+    """Offline neural TTS with a warm piper process.
+
+    The voice model is loaded once; each line is sent as a JSON request on
+    stdin and piper answers with the path of the WAV it wrote.
+    """
+
+    remote = False
+
+    def __init__(self, options):
+        super().__init__(options)
+        self.process = None
+        self.lock = threading.Lock()
+
+    def voice(self):
+        return {
+            "service": "piper",
+            "model": self.options.get("model", "en_US-lessac-medium.onnx"),
+            "speaker": self.options.get("speaker"),
+            "length_scale": self.options.get("length_scale", 1.0),
+        }
+
+    def _start(self):
+        binary = shutil.which("piper")
+        if binary is None:
+            raise RuntimeError("piper not found in PATH.")
+        voice = self.voice()
+        command = [binary, '--model', voice["model"], '--json-input', '--length_scale', str(voice["length_scale"])]
+        if voice["speaker"] is not None:
+            command += ['--speaker', str(voice["speaker"])]
+        print(f"Starting piper with voice model {voice['model']}...")
+        self.process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        )
+
+    def synthesize(self, text, output_file):
+        wav_file = f"{os.path.splitext(output_file)[0]}.wav"
+        # One warm process serves every line, so requests take turns
+        with self.lock:
+            if self.process is None or self.process.poll() is not None:
+                self._start()
+            self.process.stdin.write(json.dumps({"text": text, "output_file": os.path.abspath(wav_file)}) + "\n")
+            self.process.stdin.flush()
+            written = self.process.stdout.readline().strip()
+        if not written or not os.path.exists(wav_file):
+            raise RuntimeError(f"piper did not produce {wav_file}")
+        with open(wav_file, "rb") as f:
+            wav_bytes = f.read()
+        os.remove(wav_file)
+        encode_mp3(wav_bytes, output_file)
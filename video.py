@@ -2,15 +2,22 @@ import os
 import cv2
 import numpy as np
 import math
-from pydub import AudioSegment
 import subprocess
-import captacity
 import json
 import math
+import multiprocessing
 import shutil
+import audioprobe
+import captions
+import time
+import transcription
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from framesource import SceneImages, load_scene_image
+from encoding import AUDIO_CODEC_ARGS, FFmpegWriter, container_args, filter_path, video_codec_args
 
 def get_audio_duration(audio_file):
-    return len(AudioSegment.from_file(audio_file))
+    return audioprobe.mp3_duration_ms(audio_file)
 
 def resize_image(image, width, height, extra_width=10, extra_height=10):
     aspect_ratio = image.shape[1] / image.shape[0]
@@ -31,7 +38,134 @@ def resize_image(image, width, height, extra_width=10, extra_height=10):
     
     return final_image
 
-def create(narrations, output_dir, output_filename, settings):
+def prepare_logo(logo):
+    """Split a logo into a premultiplied colour layer and an inverse alpha mask.
+
+    Doing this once up front means each frame only needs a multiply-add over
+    the logo region instead of a full-frame copy and per-channel blend.
+    """
+    if logo is None:
+        return None
+    if logo.shape[2] == 4:
+        alpha = logo[:, :, 3:4].astype(np.float32) / 255.0
+        premultiplied = logo[:, :, :3].astype(np.float32) * alpha
+        return premultiplied, 1.0 - alpha
+    # If no alpha channel, the logo fully covers the region
+    opaque = np.zeros(logo.shape[:2] + (1,), dtype=np.float32)
+    return logo[:, :, :3].astype(np.float32), opaque
+
+def apply_logo(frames, logo_layer, pos_x, pos_y):
+    """Blend a prepared logo into a frame or a (n, h, w, 3) batch of frames in place."""
+    if logo_layer is None:
+        return frames
+    premultiplied, inverse_alpha = logo_layer
+    logo_h, logo_w = premultiplied.shape[:2]
+    region = frames[..., pos_y:pos_y+logo_h, pos_x:pos_x+logo_w, :]
+    region[...] = region * inverse_alpha + premultiplied
+    return frames
+
+def slide_transition(current_image, next_image, frame_count):
+    """Build all frames of the slide from current_image to next_image as one batch.
+
+    Frame k shows current_image shifted left by k/frame_count of the width,
+    with next_image filling the uncovered columns on the right.
+    """
+    height, width = current_image.shape[:2]
+    if frame_count <= 0:
+        return np.empty((0, height, width, 3), dtype=np.uint8)
+    offsets = (np.arange(frame_count) / frame_count * width).astype(np.int64)
+    offsets = np.minimum(offsets, width - 1)
+    columns = np.arange(width)
+    shifted = columns[None, :] + offsets[:, None]
+    # Index into [current | next] laid side by side
+    source_columns = np.where(shifted < width, shifted, width + columns[None, :])
+    strip = np.concatenate([current_image, next_image], axis=1)
+    frames = np.take(strip, source_columns, axis=1)  # (h, n, w, 3)
+    return np.ascontiguousarray(frames.transpose(1, 0, 2, 3))
+
+def scene_frame_budget(narration_data, index, frame_rate, slide_speed_multiplier):
+    """Return (static_frames, slide_frames) for the scene at index."""
+    # Calculate frames for this narration
+    duration_ms = narration_data[index]["duration"]
+    frames_for_narration = int((duration_ms / 1000) * frame_rate)
+
+    if index + 1 < len(narration_data):
+        # For images with transitions, reserve frames for the slide effect
+        slide_frames = int(frame_rate / slide_speed_multiplier)
+        return max(frames_for_narration - slide_frames, 0), slide_frames
+    # For the last image, no transition needed
+    return frames_for_narration, 0
+
+def write_scene(out, scene, logo_overlay, caption_renderer, frame_index, frame_rate):
+    """Write one scene's static frames and outgoing slide; returns the next frame index."""
+    # Blend the logo once per distinct image; static frames reuse the result
+    current_frame = apply_logo(scene["current"].copy(), *logo_overlay)
+
+    # Write the static image frames with logo
+    if caption_renderer is None:
+        for _ in range(scene["static_frames"]):
+            out.write(current_frame)
+    else:
+        for frame in caption_renderer.still_frames(current_frame, frame_index, scene["static_frames"], frame_rate):
+            out.write(frame)
+    frame_index += scene["static_frames"]
+
+    # Add sliding effect with logo, built and blended as one batch
+    if scene["slide_frames"]:
+        transition = slide_transition(scene["current"], scene["next"], scene["slide_frames"])
+        apply_logo(transition, *logo_overlay)
+        for frame in transition:
+            if caption_renderer is not None:
+                caption_renderer.draw(frame, caption_renderer.state_at(frame_index / frame_rate))
+            out.write(frame)
+            frame_index += 1
+    return frame_index
+
+def iter_scenes(narration_data, output_dir, width, height, frame_rate, slide_speed_multiplier):
+    """Yield each scene's image, the image it slides into and its frame budget.
+
+    Every scene except the last reserves slide_frames at its end for the slide
+    into the next image; the remaining frames show the image unchanged.
+    Images come from a prefetching cache so the caller never waits on decode.
+    """
+    with SceneImages(output_dir, width, height) as images:
+        if len(narration_data) > 1:
+            images.prefetch(2)
+        for i, narration_item in enumerate(narration_data):
+            current_image = images.get(i + 1)
+            # Decode the image after next while this scene is being written
+            if i + 2 < len(narration_data):
+                images.prefetch(i + 3)
+            if current_image is None:
+                raise RuntimeError(f"Failed to load image: {os.path.join(output_dir, 'images', f'image_{i+1}.png')}")
+
+            next_image = None
+            if i + 1 < len(narration_data):
+                next_image = images.get(i + 2)
+                if next_image is None:
+                    # If the next image is missing, just use a black frame as fallback for transition
+                    next_image = np.zeros((height, width, 3), dtype=np.uint8)
+
+            static_frames, slide_frames = scene_frame_budget(narration_data, i, frame_rate, slide_speed_multiplier)
+            yield {
+                "index": i,
+                "current": current_image,
+                "next": next_image,
+                "static_frames": static_frames,
+                "slide_frames": slide_frames,
+            }
+
+@contextmanager
+def timed(timings, stage):
+    """Add the wall time of the block to timings[stage] when a timings dict is given."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - started
+
+def create(narrations, output_dir, output_filename, settings, timings=None, usage=None):
     # Retrieve video settings
     video_settings = settings.get("video", {})
     width = video_settings.get("width", 720)  # 9:16 aspect ratio
@@ -39,6 +173,12 @@ def create(narrations, output_dir, output_filename, settings):
     frame_rate = video_settings.get("fps", 30)
     codec = video_settings.get("codec", "avc1")
     slide_speed_multiplier = video_settings.get("slide_speed_multiplier", 1)  # Default to 1 if not set
+    # "opencv" writes temp_video.mp4 and post-processes it; "pipe" encodes the final file in one ffmpeg pass;
+    # "segments" encodes still stretches as looped images and only renders transitions frame by frame;
+    # "parallel" renders each scene as its own chunk in a process pool and stream-copies the chunks together
+    render_mode = video_settings.get("render_mode", "opencv")
+    # "captacity" burns captions after rendering; "native" draws cached word sprites into each frame
+    caption_renderer_name = settings.get("captions", {}).get("renderer", "captacity")
 
         # Get branding settings
     branding_settings = settings.get("branding", {})
@@ -61,46 +201,6 @@ def create(narrations, output_dir, output_filename, settings):
         narration_data = json.load(f)
 
 
-    # Create a VideoWriter object
-    fourcc = cv2.VideoWriter_fourcc(*codec)
-    temp_video = os.path.join(output_dir, "temp_video.mp4")
-    out = cv2.VideoWriter(temp_video, fourcc, frame_rate, (width, height))
-    # Fallback if the requested codec isn't available (e.g., avc1/H.264)
-    if not out.isOpened():
-        fallback_codec = 'mp4v'
-        fourcc = cv2.VideoWriter_fourcc(*fallback_codec)
-        out = cv2.VideoWriter(temp_video, fourcc, frame_rate, (width, height))
-        if out.isOpened():
-            print(f"Warning: Requested codec '{codec}' unavailable. Using fallback '{fallback_codec}'.")
-        else:
-            raise RuntimeError("Failed to initialize VideoWriter with both primary and fallback codecs.")
-
-    def add_logo_to_frame(frame):
-        if logo is None:
-            return frame
-        
-        # Create a copy of the frame
-        result = frame.copy()
-        
-        # Calculate logo position from bottom right
-        pos_x = width - logo.shape[1] - logo_x
-        pos_y = height - logo.shape[0] - logo_y
-        
-        # If logo has alpha channel (PNG)
-        if logo.shape[2] == 4:
-            # Get alpha channel
-            alpha = logo[:, :, 3] / 255.0
-            # Get RGB channels
-            for c in range(3):
-                result[pos_y:pos_y+logo.shape[0], pos_x:pos_x+logo.shape[1], c] = \
-                    (1 - alpha) * result[pos_y:pos_y+logo.shape[0], pos_x:pos_x+logo.shape[1], c] + \
-                    alpha * logo[:, :, c]
-        else:
-            # If no alpha channel, just overlay the logo
-            result[pos_y:pos_y+logo.shape[0], pos_x:pos_x+logo.shape[1]] = logo[:, :, :3]
-            
-        return result
-
     # Ensure at least one generated image exists before proceeding
     first_image_path = os.path.join(output_dir, "images", "image_1.png")
     if not os.path.exists(first_image_path):
@@ -109,69 +209,107 @@ def create(narrations, output_dir, output_filename, settings):
             "Image generation likely failed earlier. Check the logs above."
         )
 
-    for i, narration_item in enumerate(narration_data):
-        current_image_path = os.path.join(output_dir, "images", f"image_{i+1}.png")
-        current_image = cv2.imread(current_image_path)
-        if current_image is None:
-            raise RuntimeError(f"Failed to load image: {current_image_path}")
-        current_image = cv2.resize(current_image, (width, height))
-
-        # Load the next image if it exists
-        if i + 1 < len(narration_data):
-            next_image_path = os.path.join(output_dir, "images", f"image_{i+2}.png")
-            next_image = cv2.imread(next_image_path)
-            if next_image is None:
-                # If the next image is missing, just use a black frame as fallback for transition
-                next_image = np.zeros((height, width, 3), dtype=np.uint8)
-            else:
-                next_image = cv2.resize(next_image, (width, height))
-        else:
-            next_image = np.zeros((height, width, 3), dtype=np.uint8)
+    logo_layer = prepare_logo(logo)
+    if logo is not None:
+        # Calculate logo position from bottom right
+        logo_pos_x = width - logo.shape[1] - logo_x
+        logo_pos_y = height - logo.shape[0] - logo_y
+    else:
+        logo_pos_x = logo_pos_y = 0
+    logo_overlay = (logo_layer, logo_pos_x, logo_pos_y)
+
+    output_path = os.path.join(output_dir, output_filename)
+    if render_mode == "segments":
+        with timed(timings, "frames"):
+            render_segments(narrations, narration_data, output_dir, output_path, settings, logo_overlay)
+        link_or_copy(output_path, os.path.join(output_dir, "final_output.mp4"))
+        print("Video assembled from still and transition segments.")
+        return
+    if render_mode == "parallel":
+        with timed(timings, "frames"):
+            render_chunks(narrations, narration_data, output_dir, output_path, settings, logo_overlay, usage=usage)
+        link_or_copy(output_path, os.path.join(output_dir, "final_output.mp4"))
+        print("Video assembled from parallel chunks.")
+        return
+
+    caption_renderer = None
+    if caption_renderer_name == "native":
+        with timed(timings, "captions"):
+            segments = create_segments(narrations, output_dir, settings)
+            style = captions.caption_style(settings.get("captions", {}))
+            caption_renderer = captions.CaptionRenderer(segments, style, width, height)
 
-        # Calculate frames for this narration
-        duration_ms = narration_item["duration"]
-        frames_for_narration = int((duration_ms / 1000) * frame_rate)
-
-        if i + 1 < len(narration_data):
-            # For images with transitions, reserve frames for the slide effect
-            slide_frames = int(frame_rate / slide_speed_multiplier)
-            static_frames = frames_for_narration - slide_frames
-            
-            # Write the static image frames with logo
-            for _ in range(static_frames):
-                frame_with_logo = add_logo_to_frame(current_image)
-                out.write(frame_with_logo)
-
-            # Add sliding effect with logo
-            for frame in range(slide_frames):
-                offset = int((frame / slide_frames) * width)
-                offset = min(offset, width - 1)
-                
-                slide_image = next_image.copy()
-                slide_image[:, :width-offset] = current_image[:, offset:]
-                
-                # Add logo to the slide frame
-                frame_with_logo = add_logo_to_frame(slide_image)
-                out.write(frame_with_logo)
-        else:
-            # For the last image, no transition needed
-            for _ in range(frames_for_narration):
-                frame_with_logo = add_logo_to_frame(current_image)
-                out.write(frame_with_logo)
-
-    out.release()
+    temp_video = os.path.join(output_dir, "temp_video.mp4")
+    if render_mode == "pipe":
+        out, pipe_temp_files = open_single_pass_writer(
+            narrations, output_dir, output_path, settings, burn_captions=caption_renderer is None
+        )
+    else:
+        # Create a VideoWriter object
+        fourcc = cv2.VideoWriter_fourcc(*codec)
+        out = cv2.VideoWriter(temp_video, fourcc, frame_rate, (width, height))
+        # Fallback if the requested codec isn't available (e.g., avc1/H.264)
+        if not out.isOpened():
+            fallback_codec = 'mp4v'
+            fourcc = cv2.VideoWriter_fourcc(*fallback_codec)
+            out = cv2.VideoWriter(temp_video, fourcc, frame_rate, (width, height))
+            if out.isOpened():
+                print(f"Warning: Requested codec '{codec}' unavailable. Using fallback '{fallback_codec}'.")
+            else:
+                raise RuntimeError("Failed to initialize VideoWriter with both primary and fallback codecs.")
+
+    frame_index = 0
+    with timed(timings, "frames"):
+        scenes = iter_scenes(narration_data, output_dir, width, height, frame_rate, slide_speed_multiplier)
+        for scene in scenes:
+            frame_index = write_scene(out, scene, logo_overlay, caption_renderer, frame_index, frame_rate)
+        out.release()
     cv2.destroyAllWindows()
 
+    if render_mode == "pipe":
+        for temp_file in pipe_temp_files:
+            os.remove(temp_file)
+        # Narration, captions and H.264/AAC encoding already happened in the single pass
+        link_or_copy(output_path, os.path.join(output_dir, "final_output.mp4"))
+        print("Video encoded in a single pass.")
+        return
+
     # Add narration and captions as before
     with_narration = "with_narration.mp4"
-    add_narration_to_video(narrations, temp_video, output_dir, with_narration)
+    with timed(timings, "audio_mux"):
+        add_narration_to_video(narrations, temp_video, output_dir, with_narration)
 
-    # Add captions to video
-    output_path = os.path.join(output_dir, output_filename)
     input_path = os.path.join(output_dir, with_narration)
-    segments = create_segments(narrations, output_dir)
+    if caption_renderer is not None:
+        # Captions are already drawn into the frames
+        os.replace(input_path, output_path)
+    else:
+        with timed(timings, "captions"):
+            add_captacity_captions(narrations, input_path, output_dir, output_path, settings)
+        os.remove(input_path)
 
-    caption_settings = settings.get("captions", {})
+    # Clean up temporary files
+    os.remove(temp_video)
+
+    if not video_settings.get("reprocess", True):
+        # Draft renders skip the compatibility re-encode
+        link_or_copy(output_path, os.path.join(output_dir, "final_output.mp4"))
+        return
+
+    # Reprocess the final video to ensure compatibility
+    with timed(timings, "reprocess"):
+        reprocess_video(output_path, output_dir, "final_output.mp4", settings)
+
+def add_captacity_captions(narrations, input_path, output_dir, output_path, settings):
+    """Burn word-highlighted captions into input_path with Captacity, writing output_path."""
+    # Captacity pulls in MoviePy, so only load it when this caption path is used
+    import captacity
+    segments = create_segments(narrations, output_dir, settings)
+
+    # Keys Captacity does not understand are consumed by this module
+    caption_settings = {
+        key: value for key, value in settings.get("captions", {}).items() if key != "renderer"
+    }
     # Ensure ImageMagick is configured for MoviePy (used by Captacity)
     im_binary = shutil.which("magick") or shutil.which("convert")
     if im_binary:
@@ -180,14 +318,9 @@ def create(narrations, output_dir, output_filename, settings):
         raise RuntimeError(
             "ImageMagick not found in PATH. Please ensure 'imagemagick' is installed in the container."
         )
-    # Normalize caption font path to an absolute path under the project root if needed
-    font_path = caption_settings.get("font")
-    if isinstance(font_path, str) and font_path.strip():
-        base_dir = os.path.dirname(os.path.abspath(__file__))  # typically /app
-        if not os.path.isabs(font_path):
-            candidate = os.path.abspath(os.path.join(base_dir, font_path))
-            # Always pass an absolute path so Captacity does not look under its assets dir
-            caption_settings = {**caption_settings, "font": candidate}
+    # Always pass an absolute font path so Captacity does not look under its assets dir
+    if caption_settings.get("font"):
+        caption_settings = {**caption_settings, "font": captions.resolve_font(caption_settings["font"])}
     captacity.add_captions(
         video_file=input_path,
         output_file=output_path,
@@ -196,12 +329,326 @@ def create(narrations, output_dir, output_filename, settings):
         **caption_settings,
     )
 
-    # Clean up temporary files
-    os.remove(input_path)
-    os.remove(temp_video)
+def open_single_pass_writer(narrations, output_dir, output_path, settings, burn_captions=True):
+    """Open an ffmpeg pipe that muxes narration and burns captions while encoding.
 
-    # Reprocess the final video to ensure compatibility
-    reprocess_video(output_path, output_dir, "final_output.mp4")
+    Returns the writer plus the temporary input files to remove once it has
+    been released. Pass burn_captions=False when the frames already carry
+    captions from the native renderer.
+    """
+    video_settings = settings.get("video", {})
+    width = video_settings.get("width", 720)
+    height = video_settings.get("height", 1280)
+    frame_rate = video_settings.get("fps", 30)
+
+    temp_files = []
+    filter_args = []
+    if burn_captions:
+        # Transcription has to happen up front so the caption track exists before the first frame
+        subtitle_file, style = write_caption_track(narrations, output_dir, settings)
+        filter_args = ['-vf', caption_filter(subtitle_file, style)]
+        temp_files.append(subtitle_file)
+    narration_list = write_narration_list(narrations, output_dir)
+    temp_files.append(narration_list)
+
+    writer = FFmpegWriter(
+        output_path,
+        frame_rate,
+        (width, height),
+        input_args=narration_input_args(narration_list),
+        output_args=[
+            '-map', '0:v',
+            '-map', '1:a',
+            *filter_args,
+            *video_codec_args(settings),
+            *AUDIO_CODEC_ARGS,
+            *container_args(settings),
+        ],
+    )
+    return writer, temp_files
+
+def write_caption_track(narrations, output_dir, settings, segments=None):
+    """Transcribe the narration and write it as captions.ass; returns the path and caption style."""
+    width = settings.get("video", {}).get("width", 720)
+    height = settings.get("video", {}).get("height", 1280)
+    if segments is None:
+        segments = create_segments(narrations, output_dir, settings)
+    style = captions.caption_style(settings.get("captions", {}))
+    subtitle_file = os.path.join(output_dir, "captions.ass")
+    captions.write_ass(captions.layout_captions(segments, style, width), subtitle_file, style, width, height)
+    return subtitle_file, style
+
+def caption_filter(subtitle_file, style, offset=0.0):
+    """Build the ffmpeg filter that burns the caption track into the video.
+
+    A non-zero offset shifts timestamps so a segment starting part-way
+    through the short picks up the captions for its own time range.
+    """
+    subtitles_filter = f"subtitles={filter_path(subtitle_file)}"
+    if style["font"] and os.path.exists(style["font"]):
+        subtitles_filter += f":fontsdir={filter_path(os.path.dirname(style['font']))}"
+    if offset:
+        return f"setpts=PTS+{offset:.6f}/TB,{subtitles_filter},setpts=PTS-STARTPTS"
+    return subtitles_filter
+
+# Segments only concatenate cleanly when every MP4 shares the same track timescale
+SEGMENT_MUX_ARGS = ['-video_track_timescale', '90000']
+
+def segment_encode_args(settings, video_filter=None):
+    """Output options shared by every piece of a short that is later stream-copied together."""
+    frame_rate = settings.get("video", {}).get("fps", 30)
+    filter_args = ['-vf', video_filter] if video_filter else []
+    # Force CFR output; filters that shift timestamps otherwise leave ffmpeg guessing the rate
+    return [*filter_args, '-r', str(frame_rate), *video_codec_args(settings), *SEGMENT_MUX_ARGS]
+
+def render_segments(narrations, narration_data, output_dir, output_path, settings, logo_overlay):
+    """Render the short as still-image and transition segments joined by the concat demuxer.
+
+    Each static stretch is encoded by ffmpeg from a single looped image, so
+    only the slide transitions are pushed through Python frame by frame.
+    Captions are burned per segment and the narration is muxed while the
+    segments are stream-copied into the final file.
+    """
+    video_settings = settings.get("video", {})
+    width = video_settings.get("width", 720)
+    height = video_settings.get("height", 1280)
+    frame_rate = video_settings.get("fps", 30)
+    slide_speed_multiplier = video_settings.get("slide_speed_multiplier", 1)
+
+    segment_dir = os.path.join(output_dir, "segments")
+    os.makedirs(segment_dir, exist_ok=True)
+    subtitle_file, style = write_caption_track(narrations, output_dir, settings)
+
+    segment_files = []
+    frame_offset = 0
+    for scene in iter_scenes(narration_data, output_dir, width, height, frame_rate, slide_speed_multiplier):
+        if scene["static_frames"]:
+            still_path = os.path.join(segment_dir, f"still_{scene['index'] + 1}.png")
+            cv2.imwrite(still_path, apply_logo(scene["current"].copy(), *logo_overlay), [cv2.IMWRITE_PNG_COMPRESSION, 1])
+            segment_file = os.path.join(segment_dir, f"segment_{len(segment_files) + 1:03d}.mp4")
+            run_ffmpeg([
+                'ffmpeg', '-y', '-loglevel', 'error',
+                '-loop', '1',
+                '-framerate', str(frame_rate),
+                '-i', still_path,
+                '-frames:v', str(scene["static_frames"]),
+                *segment_encode_args(settings, caption_filter(subtitle_file, style, frame_offset / frame_rate)),
+                segment_file,
+            ], f"encode still segment {segment_file}")
+            segment_files.append(segment_file)
+            frame_offset += scene["static_frames"]
+
+        if scene["slide_frames"]:
+            segment_file = os.path.join(segment_dir, f"segment_{len(segment_files) + 1:03d}.mp4")
+            transition = slide_transition(scene["current"], scene["next"], scene["slide_frames"])
+            apply_logo(transition, *logo_overlay)
+            writer = FFmpegWriter(
+                segment_file,
+                frame_rate,
+                (width, height),
+                output_args=segment_encode_args(settings, caption_filter(subtitle_file, style, frame_offset / frame_rate)),
+            )
+            for frame in transition:
+                writer.write(frame)
+            writer.release()
+            segment_files.append(segment_file)
+            frame_offset += scene["slide_frames"]
+
+    narration_list = write_narration_list(narrations, output_dir)
+    concat_segments(segment_files, output_path, segment_dir, narration_list=narration_list, settings=settings)
+
+    os.remove(narration_list)
+    os.remove(subtitle_file)
+    shutil.rmtree(segment_dir)
+
+def render_chunks(narrations, narration_data, output_dir, output_path, settings, logo_overlay, usage=None):
+    """Render every scene with its outgoing slide as an independent chunk across CPU cores.
+
+    Chunks are encoded with identical options in a process pool, then joined
+    in order with the concat demuxer while the narration is muxed in, so the
+    only serial work left is transcription and a stream copy. The pool
+    workers are never reaped by this process, so when a usage dict is given
+    their bytes written and peak RSS are added to it for benchmark.py.
+    """
+    video_settings = settings.get("video", {})
+    frame_rate = video_settings.get("fps", 30)
+    slide_speed_multiplier = video_settings.get("slide_speed_multiplier", 1)
+    workers = video_settings.get("workers") or os.cpu_count() or 1
+
+    chunk_dir = os.path.join(output_dir, "chunks")
+    os.makedirs(chunk_dir, exist_ok=True)
+
+    segments = create_segments(narrations, output_dir, settings)
+    native_captions = settings.get("captions", {}).get("renderer", "captacity") == "native"
+    style = captions.caption_style(settings.get("captions", {}))
+    subtitle_file = None
+    if not native_captions:
+        subtitle_file, style = write_caption_track(narrations, output_dir, settings, segments=segments)
+
+    jobs = []
+    frame_offset = 0
+    for i in range(len(narration_data)):
+        static_frames, slide_frames = scene_frame_budget(narration_data, i, frame_rate, slide_speed_multiplier)
+        video_filter = None
+        if subtitle_file:
+            video_filter = caption_filter(subtitle_file, style, frame_offset / frame_rate)
+        jobs.append({
+            "output_dir": output_dir,
+            "index": i,
+            "has_next": i + 1 < len(narration_data),
+            "static_frames": static_frames,
+            "slide_frames": slide_frames,
+            "first_frame": frame_offset,
+            "logo_overlay": logo_overlay,
+            "segments": segments if native_captions else None,
+            "style": style,
+            "settings": settings,
+            "output_args": segment_encode_args(settings, video_filter),
+            "chunk_file": os.path.join(chunk_dir, f"chunk_{i + 1:03d}.mp4"),
+        })
+        frame_offset += static_frames + slide_frames
+
+    print(f"Rendering {len(jobs)} chunks with {min(workers, len(jobs))} workers...")
+    # video.create runs in a stage thread next to other busy threads (Whisper, HTTP pools,
+    # other shorts), and forking a multithreaded process can leave their locks held in the child
+    context = multiprocessing.get_context("forkserver")
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=context) as pool:
+        chunks = list(pool.map(render_chunk, jobs))
+    chunk_files = [chunk["chunk_file"] for chunk in chunks]
+    if usage is not None:
+        written = [chunk["written_bytes"] for chunk in chunks]
+        usage["worker_written_bytes"] = None if None in written else sum(written)
+        usage["worker_peak_rss_mb"] = max(chunk["peak_rss_mb"] for chunk in chunks)
+
+    narration_list = write_narration_list(narrations, output_dir)
+    concat_segments(chunk_files, output_path, chunk_dir, narration_list=narration_list, settings=settings)
+
+    os.remove(narration_list)
+    if subtitle_file:
+        os.remove(subtitle_file)
+    shutil.rmtree(chunk_dir)
+
+def written_bytes():
+    """Bytes this process and its reaped children have written to storage, from /proc/self/io.
+
+    None where /proc is unavailable (not Linux). Writes to tmpfs never reach
+    storage and are not counted.
+    """
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(":") for line in f if ":" in line)
+    except OSError:
+        return None
+    return int(counters["write_bytes"])
+
+def render_chunk(job):
+    """Render one chunk described by render_chunks; runs in a worker process.
+
+    Returns the chunk file with the bytes the worker and its ffmpeg wrote
+    for it and the worker's peak RSS (itself or its largest ffmpeg child).
+    """
+    import resource
+
+    written_before = written_bytes()
+    video_settings = job["settings"].get("video", {})
+    width = video_settings.get("width", 720)
+    height = video_settings.get("height", 1280)
+    frame_rate = video_settings.get("fps", 30)
+
+    image_number = job["index"] + 1
+    current_image = load_scene_image(job["output_dir"], image_number, width, height)
+    if current_image is None:
+        raise RuntimeError(f"Failed to load image: {os.path.join(job['output_dir'], 'images', f'image_{image_number}.png')}")
+    next_image = None
+    if job["has_next"]:
+        next_image = load_scene_image(job["output_dir"], image_number + 1, width, height)
+        if next_image is None:
+            next_image = np.zeros((height, width, 3), dtype=np.uint8)
+    scene = {
+        "index": job["index"],
+        "current": current_image,
+        "next": next_image,
+        "static_frames": job["static_frames"],
+        "slide_frames": job["slide_frames"],
+    }
+
+    caption_renderer = None
+    if job["segments"] is not None:
+        caption_renderer = captions.CaptionRenderer(job["segments"], job["style"], width, height)
+
+    writer = FFmpegWriter(job["chunk_file"], frame_rate, (width, height), output_args=job["output_args"])
+    write_scene(writer, scene, job["logo_overlay"], caption_renderer, job["first_frame"], frame_rate)
+    writer.release()
+
+    written_after = written_bytes()
+    # ru_maxrss is reported in KiB on Linux
+    peak_rss_kib = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                       resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return {
+        "chunk_file": job["chunk_file"],
+        "written_bytes": None if written_before is None or written_after is None else written_after - written_before,
+        "peak_rss_mb": round(peak_rss_kib / 1024, 1),
+    }
+
+def concat_segments(segment_files, output_path, work_dir, narration_list=None, settings=None):
+    """Join identically encoded video segments without re-encoding, optionally muxing the narration."""
+    list_file = os.path.join(work_dir, "segments.txt")
+    with open(list_file, "w") as f:
+        for segment_file in segment_files:
+            escaped = os.path.abspath(segment_file).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    command = ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', list_file]
+    if narration_list:
+        command += [*narration_input_args(narration_list), '-map', '0:v', '-map', '1:a', *AUDIO_CODEC_ARGS]
+    command += ['-c:v', 'copy', *container_args(settings), output_path]
+    run_ffmpeg(command, f"concatenate segments into {output_path}")
+
+def run_ffmpeg(command, description):
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"FFmpeg failed to {description}: {result.stderr.strip()[-2000:]}")
+
+def link_or_copy(source, destination):
+    """Expose source under a second name without duplicating data when possible."""
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+def load_narration_durations(output_dir):
+    """Map narration clip filenames to the durations (ms) stored in narration.json."""
+    narration_json = os.path.join(output_dir, "narration.json")
+    if not os.path.exists(narration_json):
+        return {}
+    with open(narration_json, "r") as f:
+        return {item["filename"]: item["duration"] for item in json.load(f)}
+
+def write_narration_list(narrations, output_dir):
+    """Write an ffconcat list of the narration clips and return its path.
+
+    ffmpeg reads the clips through the concat demuxer and encodes them to AAC
+    as they stream in, so the narration is never held in memory or written
+    out as an intermediate MP3. Each entry carries the clip duration recorded
+    in narration.json, which keeps audio offsets identical to the frame
+    counts the video was rendered with.
+    """
+    durations = load_narration_durations(output_dir)
+
+    list_file = os.path.join(output_dir, "narrations.txt")
+    with open(list_file, "w") as f:
+        f.write("ffconcat version 1.0\n")
+        for i, _ in enumerate(narrations):
+            filename = f"narration_{i+1}.mp3"
+            f.write(f"file 'narrations/{filename}'\n")
+            if filename in durations:
+                f.write(f"duration {durations[filename] / 1000:.3f}\n")
+    return list_file
+
+def narration_input_args(list_file):
+    return ['-f', 'concat', '-safe', '0', '-i', list_file]
 
 def add_narration_to_video(narrations, input_video, output_dir, output_file):
 # test
@@ -223,19 +670,13 @@ def add_narration_to_video(narrations, input_video, output_dir, output_file):
         print(result.stdout)
 # end test
 
-    full_narration = AudioSegment.empty()
-    for i, _ in enumerate(narrations):
-        audio = os.path.join(output_dir, "narrations", f"narration_{i+1}.mp3")
-        full_narration += AudioSegment.from_file(audio)
-
-    temp_narration = os.path.join(output_dir, "narration.mp3")
-    full_narration.export(temp_narration, format="mp3")
+    narration_list = write_narration_list(narrations, output_dir)
 
     ffmpeg_command = [
         'ffmpeg',
         '-y',
         '-i', input_video,
-        '-i', temp_narration,
+        *narration_input_args(narration_list),
         '-map', '0:v',  # Map video from the first input
         '-map', '1:a',  # Map audio from the second input
         # '-c:v', 'libx264',
@@ -255,27 +696,27 @@ def add_narration_to_video(narrations, input_video, output_dir, output_file):
     else:
         print("Video with narration created successfully.")
 
-    os.remove(temp_narration)
+    os.remove(narration_list)
+
+def create_segments(narrations, output_dir, settings=None):
+    """Transcribe every narration clip and lay the word timings out on one timeline."""
+    audio_files = [
+        os.path.join(output_dir, "narrations", f"narration_{i+1}.mp3") for i, _ in enumerate(narrations)
+    ]
+    transcripts = transcription.transcribe_batch(audio_files, narrations, settings)
+
+    # Clip lengths were measured when the narration was generated; avoid decoding them again
+    durations = load_narration_durations(output_dir)
 
-def create_segments(narrations, output_dir):
     segments = []
     offset = 0
-    for i, narration in enumerate(narrations):
-        audio_file = os.path.join(output_dir, "narrations", f"narration_{i+1}.mp3")
-        try:
-            t_segments = captacity.transcriber.transcribe_locally(
-                audio_file=audio_file,
-                prompt=narration,
-            )
-        except ImportError:
-            t_segments = captacity.transcriber.transcribe_with_api(
-                audio_file=audio_file,
-                prompt=narration,
-            )
-
+    for audio_file, t_segments in zip(audio_files, transcripts):
         o_segments = offset_segments(t_segments, offset)
         segments += o_segments
-        offset += get_audio_duration(audio_file) / 1000
+        duration_ms = durations.get(os.path.basename(audio_file))
+        if duration_ms is None:
+            duration_ms = get_audio_duration(audio_file)
+        offset += duration_ms / 1000
 
     return segments
 
@@ -288,17 +729,18 @@ def offset_segments(segments, offset):
             word["end"] += offset
     return segments
 
-def reprocess_video(input_video, output_dir, output_file):
+def reprocess_video(input_video, output_dir, output_file, settings=None):
     final_output_path = os.path.join(output_dir, output_file)
 
     ffmpeg_command = [
         'ffmpeg',
         '-y',  # Overwrite output files without asking
         '-i', input_video,
-        '-c:v', 'libx264',  # Use H.264 for video encoding
+        *video_codec_args(settings),  # H.264 with the configured encoder profile
         '-c:a', 'aac',      # Use AAC for audio encoding
         '-b:a', '192k',     # Set audio bitrate
         '-ar', '44100',     # Set audio sample rate
+        *container_args(settings),
         final_output_path
     ]
 